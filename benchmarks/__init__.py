@@ -0,0 +1 @@
+"""Benchmarks of the repository build pipelines; see benchmarks.run."""
@@ -0,0 +1,114 @@
+"""Synthetic .deb packages for benchmarking."""
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List
+import io
+import random
+import tarfile
+
+# Fixed timestamp so identical parameters produce byte-identical packages
+MTIME = 1700000000
+
+
+@dataclass
+class SyntheticPackage:
+    name: str
+    version: str
+    architecture: str
+    path: Path
+    release: int
+
+
+def _ar_member(name: str, data: bytes) -> bytes:
+    header = (
+        f"{name:<16}"
+        f"{MTIME:<12}"
+        f"{0:<6}"
+        f"{0:<6}"
+        f"{0o100644:<8o}"
+        f"{len(data):<10}"
+        "`\n"
+    ).encode('ascii')
+    padding = b"\n" if len(data) % 2 else b""
+    return header + data + padding
+
+
+def _tar_gz(files: dict, compresslevel: int = 6) -> bytes:
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w:gz', compresslevel=compresslevel) as tar:
+        for name, data in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mtime = MTIME
+            info.mode = 0o644
+            tar.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+
+def make_deb(path: Path, package: str, version: str, architecture: str, payload_size: int, seed: int) -> Path:
+    """
+    Write a minimal but valid binary package.
+
+    The data member holds payload_size bytes of seeded random data, so the
+    package is about that large and does not compress.
+    """
+    control = (
+        f"Package: {package}\n"
+        f"Version: {version}\n"
+        f"Architecture: {architecture}\n"
+        f"Maintainer: Benchmark <bench@example.com>\n"
+        f"Installed-Size: {max(payload_size // 1024, 1)}\n"
+        f"Depends: libc6 (>= 2.31)\n"
+        f"Section: utils\n"
+        f"Priority: optional\n"
+        f"Description: Synthetic benchmark package {package}\n"
+        f" Generated to exercise the repository build pipeline.\n"
+    ).encode()
+    payload = random.Random(seed).randbytes(payload_size)
+
+    with open(path, 'wb') as f:
+        f.write(b"!<arch>\n")
+        f.write(_ar_member("debian-binary", b"2.0\n"))
+        f.write(_ar_member("control.tar.gz", _tar_gz({"./control": control})))
+        # Random data does not compress; level 1 keeps generation fast
+        f.write(_ar_member("data.tar.gz", _tar_gz({f"./usr/share/{package}/payload": payload}, compresslevel=1)))
+    return path
+
+
+def generate_packages(
+    directory: Path,
+    count: int,
+    size: int,
+    releases: int = 1,
+    architectures: List[str] = None,
+    seed: int = 0
+) -> List[SyntheticPackage]:
+    """
+    Generate count packages of about size bytes spread over releases.
+
+    Packages cycle through architectures; each release carries a new
+    version of its share of the packages.
+
+    Args:
+        directory: Where to write the .deb files
+        count: Number of packages
+        size: Payload size of each package in bytes
+        releases: Number of releases the packages are spread over
+        architectures: Architectures to cycle through (default amd64, arm64, all)
+        seed: Seed for the package payloads
+    """
+    architectures = architectures or ["amd64", "arm64", "all"]
+    releases = max(1, releases)
+    directory.mkdir(parents=True, exist_ok=True)
+
+    packages = []
+    for i in range(count):
+        release = i % releases
+        package = f"bench-pkg{i:04d}"
+        version = f"1.{release}.0-1"
+        architecture = architectures[i % len(architectures)]
+        path = directory / f"{package}_{version}_{architecture}.deb"
+        if not path.exists():
+            make_deb(path, package, version, architecture, size, seed + i)
+        packages.append(SyntheticPackage(package, version, architecture, path, release))
+    return packages
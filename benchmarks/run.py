@@ -0,0 +1,359 @@
+"""
+End-to-end benchmarks of the repository build pipelines.
+
+Generates synthetic .deb packages, serves them from a local GitHub
+stand-in and publishes to S3 (moto when installed, otherwise a local
+stand-in), timing every stage of both the AptRepoGenerator CLI pipeline
+and the RepositoryService worker pipeline.
+
+The first iteration starts from empty caches (cold); later iterations
+reuse the package index, package cache and published objects (warm).
+
+Usage (from the repository root):
+
+    python -m benchmarks.run --packages 50 --size 1048576 --output results.json
+    python -m benchmarks.run --compare results.json
+"""
+from contextlib import ExitStack, contextmanager, redirect_stdout
+from functools import partial, wraps
+from pathlib import Path
+from statistics import median
+from threading import Lock
+from typing import Dict, List
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from loguru import logger
+import main as apt_main
+from nplb.services.cache import PackageCache, ResponseCache
+from nplb.services.download import DownloadManager
+from nplb.services.github import AsyncGitHubService
+from nplb.services.repository import RepositoryService
+from nplb.services.storage import S3StorageService
+from .fixtures import generate_packages
+from .standins import BUCKET, GitHubStandIn, make_local_client, s3_backend
+
+OWNER = "bench"
+REPO = "synthetic"
+KEY_EMAIL = "repo@example.com"
+RESULTS_VERSION = 1
+
+
+class StageTimer:
+    """Accumulates wall-clock time per named stage."""
+
+    def __init__(self):
+        self.durations: Dict[str, float] = {}
+        # Stages such as compress may run in several threads at once
+        self._lock = Lock()
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.durations[name] = self.durations.get(name, 0.0) + elapsed
+
+    def wrap(self, stack: ExitStack, owner, attribute: str, name: str, **bind) -> None:
+        """Time every call to owner.attribute until stack closes."""
+        original = getattr(owner, attribute)
+        target = partial(original, **bind) if bind else original
+
+        @wraps(original)
+        def timed(*args, **kwargs):
+            with self.stage(name):
+                return target(*args, **kwargs)
+
+        if attribute in vars(owner):
+            stack.callback(setattr, owner, attribute, vars(owner)[attribute])
+        else:
+            stack.callback(delattr, owner, attribute)
+        setattr(owner, attribute, timed)
+
+
+def setup_gpg(workdir: Path) -> Path:
+    """Create a throwaway signing key usable by both pipelines."""
+    gnupg_home = workdir / "gnupg"
+    gnupg_home.mkdir(mode=0o700, exist_ok=True)
+    os.environ["GNUPGHOME"] = str(gnupg_home)
+
+    keys_dir = workdir / "keys"
+    if not (keys_dir / "private-key.gpg").exists():
+        subprocess.run([
+            "gpg", "--batch", "--passphrase", "",
+            "--quick-gen-key", f"APT Repository <{KEY_EMAIL}>", "rsa2048", "sign", "never"
+        ], check=True, capture_output=True)
+        keys_dir.mkdir(exist_ok=True)
+        # Both pipelines load the exported key from ./keys
+        subprocess.run(["gpg", "--export", "--output", str(keys_dir / "public-key.gpg"), KEY_EMAIL], check=True)
+        subprocess.run([
+            "gpg", "--batch", "--export-secret-key", "--output", str(keys_dir / "private-key.gpg"), KEY_EMAIL
+        ], check=True)
+    return gnupg_home
+
+
+def storage_service(args, workdir: Path, backend: str) -> S3StorageService:
+    storage = S3StorageService(
+        access_key_id="benchmark",
+        secret_access_key="benchmark",
+        bucket_name=BUCKET,
+        region="us-east-1",
+        max_concurrency=args.upload_concurrency
+    )
+    if backend == "local":
+        storage.client = make_local_client(workdir)
+    return storage
+
+
+def run_apt_repo_generator(args, workdir: Path, standin: GitHubStandIn, storage: S3StorageService, gnupg_home: Path) -> Dict[str, float]:
+    """Time main.process_repository stage by stage, then publish its output."""
+    timer = StageTimer()
+    output_dir = workdir / "apt-repo"
+
+    with ExitStack() as stack:
+        timer.wrap(stack, apt_main, "get_github_releases", "releases", api_url=standin.url)
+        timer.wrap(stack, apt_main.AptRepoGenerator, "init_repository", "init")
+        timer.wrap(stack, DownloadManager, "download_all", "download")
+        timer.wrap(stack, apt_main, "extract_deb_info", "extract")
+        timer.wrap(stack, apt_main.AptRepoGenerator, "add_package", "pool")
+        timer.wrap(stack, apt_main.AptRepoGenerator, "_update_index", "index")
+        timer.wrap(stack, apt_main, "compress_file", "compress")
+        timer.wrap(stack, apt_main.AptRepoGenerator, "_generate_release_file", "release")
+        timer.wrap(stack, apt_main.AptRepoGenerator, "generate_metadata", "metadata")
+
+        with timer.stage("build"):
+            apt_main.process_repository(OWNER, REPO, str(output_dir))
+
+    with timer.stage("publish"):
+        storage.publish_repository(output_dir, prefix=f"apt/{OWNER}/{REPO}")
+
+    return timer.durations
+
+
+def run_repository_service(args, workdir: Path, standin: GitHubStandIn, storage: S3StorageService, gnupg_home: Path) -> Dict[str, float]:
+    """Time the build_repository_task pipeline stage by stage."""
+    timer = StageTimer()
+    state_dir = workdir / "service-state"
+    state_dir.mkdir(exist_ok=True)
+
+    github_service = AsyncGitHubService(
+        None,
+        response_cache=ResponseCache(str(state_dir / "github_cache.sqlite")),
+        api_url=standin.url
+    )
+    repo_service = RepositoryService(
+        repo_name=f"{OWNER}/{REPO}",
+        base_url="https://example.com",
+        gpg_home=str(workdir / "keys"),
+        gpg_key_email=KEY_EMAIL,
+        package_cache=PackageCache(str(state_dir / "package_cache.sqlite")),
+        index_path=str(state_dir / f"{OWNER}_{REPO}.json"),
+        compression_formats=args.compression,
+        download_manager=DownloadManager(
+            max_workers=args.download_concurrency,
+            per_host_limit=args.download_per_host_limit
+        )
+    )
+
+    with ExitStack() as stack:
+        timer.wrap(stack, repo_service, "download_artifacts", "download")
+        timer.wrap(stack, repo_service, "_update_index", "index")
+        timer.wrap(stack, repo_service, "_compress_file", "compress")
+        timer.wrap(stack, repo_service, "_generate_release_file", "release")
+        timer.wrap(stack, repo_service, "_sign_release", "sign")
+        timer.wrap(stack, repo_service, "generate_metadata", "metadata")
+
+        with timer.stage("build"):
+            with timer.stage("releases"):
+                releases = asyncio.run(github_service.get_releases(OWNER, REPO, args.releases))
+            try:
+                repo_service.create_repository()
+                # The worker's default: assets stream from GitHub straight into the S3 pool
+                pool_sink = storage.pool_uploads(f"{OWNER}/{REPO}/pool/main") if args.direct_pool_upload else None
+                repo_service.download_artifacts(releases, pool_sink=pool_sink)
+                repo_service.generate_metadata()
+                with timer.stage("publish"):
+                    storage.publish_repository(repo_service.temp_dir, prefix=f"{OWNER}/{REPO}")
+                repo_service.commit_package_cache()
+            finally:
+                repo_service.cleanup()
+
+    return timer.durations
+
+
+PIPELINES = {
+    "apt_repo_generator": run_apt_repo_generator,
+    "repository_service": run_repository_service,
+}
+
+
+def summarize(iterations: List[dict]) -> Dict[str, Dict[str, Dict[str, float]]]:
+    """Median duration per pipeline, cache state and stage."""
+    grouped: Dict[str, Dict[str, Dict[str, List[float]]]] = {}
+    for iteration in iterations:
+        stages = grouped.setdefault(iteration["pipeline"], {}).setdefault(iteration["state"], {})
+        for stage, seconds in iteration["stages"].items():
+            stages.setdefault(stage, []).append(seconds)
+    return {
+        pipeline: {
+            state: {stage: round(median(values), 6) for stage, values in sorted(stages.items())}
+            for state, stages in states.items()
+        }
+        for pipeline, states in grouped.items()
+    }
+
+
+def compare(summary: dict, baseline: dict, threshold: float, min_seconds: float) -> List[str]:
+    """
+    Print per-stage changes against a baseline summary.
+
+    Returns:
+        Descriptions of stages that got slower by more than threshold
+    """
+    regressions = []
+    print(f"\n{'pipeline':<20} {'state':<6} {'stage':<10} {'baseline':>10} {'current':>10} {'change':>8}")
+    for pipeline, states in sorted(summary.items()):
+        for state, stages in sorted(states.items()):
+            for stage, current in stages.items():
+                previous = baseline.get(pipeline, {}).get(state, {}).get(stage)
+                if previous is None:
+                    continue
+                change = (current - previous) / previous if previous else 0.0
+                flag = ""
+                if change > threshold and current - previous > min_seconds:
+                    flag = "  REGRESSION"
+                    regressions.append(f"{pipeline}/{state}/{stage}: {previous:.3f}s -> {current:.3f}s")
+                print(f"{pipeline:<20} {state:<6} {stage:<10} {previous:>10.3f} {current:>10.3f} {change:>+8.1%}{flag}")
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the repository build pipelines")
+    parser.add_argument("--packages", type=int, default=20, help="Number of synthetic packages")
+    parser.add_argument("--size", type=int, default=512 * 1024, help="Payload bytes per package")
+    parser.add_argument("--releases", type=int, default=2, help="Releases the packages are spread over")
+    parser.add_argument("--iterations", type=int, default=2, help="Runs per pipeline; the first is cold")
+    parser.add_argument("--pipelines", nargs="+", choices=sorted(PIPELINES), default=sorted(PIPELINES))
+    parser.add_argument("--compression", default="gz,xz", help="Comma-separated Packages compression formats")
+    parser.add_argument("--download-concurrency", type=int, default=8)
+    parser.add_argument("--download-per-host-limit", type=int, default=4)
+    parser.add_argument("--upload-concurrency", type=int, default=8)
+    parser.add_argument("--direct-pool-upload", action=argparse.BooleanOptionalAction, default=True,
+                        help="Stream assets straight into the S3 pool in the repository_service pipeline")
+    parser.add_argument("--s3", choices=["auto", "moto", "local"], default="auto", help="S3 backend")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for package contents")
+    parser.add_argument("--workdir", type=Path, help="Keep fixtures and state here instead of a temporary directory")
+    parser.add_argument("--output", type=Path, help="Write results as JSON to this file")
+    parser.add_argument("--compare", type=Path, help="Baseline results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Relative slowdown reported as a regression")
+    parser.add_argument("--min-seconds", type=float, default=0.05, help="Ignore slowdowns smaller than this")
+    parser.add_argument("--verbose", action="store_true", help="Show pipeline output")
+    args = parser.parse_args(argv)
+    args.compression = [fmt for fmt in args.compression.split(",") if fmt]
+    return args
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    if not args.verbose:
+        logger.remove()
+        logger.add(sys.stderr, level="WARNING")
+
+    # process_repository reads its tuning from the environment
+    os.environ["NPLB_COMPRESSION_FORMATS"] = ",".join(args.compression)
+    os.environ["NPLB_DOWNLOAD_CONCURRENCY"] = str(args.download_concurrency)
+    os.environ["NPLB_DOWNLOAD_PER_HOST_LIMIT"] = str(args.download_per_host_limit)
+    os.environ.pop("GITHUB_TOKEN", None)
+
+    workdir = (args.workdir or Path(tempfile.mkdtemp(prefix="nplb-bench-"))).resolve()
+    workdir.mkdir(parents=True, exist_ok=True)
+    cwd = os.getcwd()
+
+    try:
+        # AptRepoGenerator keeps its signing keys in ./keys
+        os.chdir(workdir)
+        gnupg_home = setup_gpg(workdir)
+
+        start = time.perf_counter()
+        packages = generate_packages(workdir / "fixtures", args.packages, args.size, args.releases, seed=args.seed)
+        fixture_seconds = time.perf_counter() - start
+        print(f"Generated {len(packages)} packages in {fixture_seconds:.2f}s ({workdir})")
+
+        iterations = []
+        with GitHubStandIn(OWNER, REPO, packages) as standin, s3_backend(workdir, args.s3) as backend:
+            print(f"Serving fixtures at {standin.url}, S3 backend: {backend}")
+            storage = storage_service(args, workdir, backend)
+
+            for pipeline in args.pipelines:
+                for iteration in range(args.iterations):
+                    out = sys.stdout if args.verbose else io.StringIO()
+                    with redirect_stdout(out):
+                        stages = PIPELINES[pipeline](args, workdir, standin, storage, gnupg_home)
+                    state = "cold" if iteration == 0 else "warm"
+                    iterations.append({
+                        "pipeline": pipeline,
+                        "iteration": iteration,
+                        "state": state,
+                        "stages": {stage: round(seconds, 6) for stage, seconds in sorted(stages.items())},
+                    })
+                    stage_text = ", ".join(f"{stage}={seconds:.3f}s" for stage, seconds in sorted(stages.items()))
+                    print(f"{pipeline} #{iteration} ({state}): {stage_text}")
+    finally:
+        os.chdir(cwd)
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    results = {
+        "version": RESULTS_VERSION,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "config": {
+            "packages": args.packages,
+            "size": args.size,
+            "releases": args.releases,
+            "iterations": args.iterations,
+            "compression": args.compression,
+            "download_concurrency": args.download_concurrency,
+            "download_per_host_limit": args.download_per_host_limit,
+            "upload_concurrency": args.upload_concurrency,
+            "direct_pool_upload": args.direct_pool_upload,
+            "s3": backend,
+            "seed": args.seed,
+        },
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "iterations": iterations,
+        "summary": summarize(iterations),
+    }
+
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2, sort_keys=True) + "\n")
+        print(f"Wrote {args.output}")
+
+    if args.compare:
+        baseline = json.loads(args.compare.read_text())
+        if baseline.get("config") != results["config"]:
+            print("Warning: baseline was recorded with a different configuration", file=sys.stderr)
+        regressions = compare(results["summary"], baseline.get("summary", {}), args.threshold, args.min_seconds)
+        if regressions:
+            print(f"\n{len(regressions)} stage(s) regressed:\n  " + "\n  ".join(regressions))
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
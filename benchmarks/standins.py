@@ -0,0 +1,333 @@
+"""Local stand-ins for GitHub and S3 so benchmarks run offline and repeatably."""
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from threading import Lock, Thread
+from typing import Dict, Iterator, List
+from urllib.parse import parse_qs, urlparse
+import hashlib
+import io
+import json
+import os
+import shutil
+from boto3.s3.transfer import TransferConfig
+from botocore.exceptions import ClientError
+from s3transfer.utils import ChunksizeAdjuster
+from .fixtures import SyntheticPackage
+
+BUCKET = "nplb-benchmark"
+
+
+class GitHubStandIn:
+    """
+    Serves a GitHub REST API subset and release asset downloads.
+
+    Covers what both release clients use: /repos/{owner}/{repo},
+    paginated /releases with Link and ETag headers, /releases/{id}/assets
+    and browser download URLs.
+    """
+
+    def __init__(self, owner: str, repo: str, packages: List[SyntheticPackage]):
+        self.owner = owner
+        self.repo = repo
+        self.files: Dict[str, Path] = {package.path.name: package.path for package in packages}
+        self.requests = 0
+        self.bytes_served = 0
+        self._lock = Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+        by_release: Dict[int, List[SyntheticPackage]] = {}
+        for package in packages:
+            by_release.setdefault(package.release, []).append(package)
+
+        # Newest release first, as GitHub lists them
+        self.releases = []
+        for number in sorted(by_release, reverse=True):
+            self.releases.append({
+                'id': number + 1,
+                'tag_name': f"v1.{number}.0",
+                'name': f"Release 1.{number}.0",
+                'published_at': datetime(2024, 1, 1 + number % 28, tzinfo=timezone.utc).isoformat(),
+                'assets': [self._asset(package) for package in by_release[number]],
+            })
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def repo_url(self) -> str:
+        return f"{self.url}/repos/{self.owner}/{self.repo}"
+
+    def _asset(self, package: SyntheticPackage) -> dict:
+        stat = package.path.stat()
+        return {
+            'id': int(hashlib.sha256(package.path.name.encode()).hexdigest()[:8], 16),
+            'name': package.path.name,
+            'size': stat.st_size,
+            'updated_at': datetime.fromtimestamp(int(stat.st_mtime), tz=timezone.utc).isoformat(),
+            'content_type': 'application/vnd.debian.binary-package',
+            'browser_download_url': None,  # filled in per request with the bound address
+        }
+
+    def _releases_json(self, base: str) -> List[dict]:
+        releases = []
+        for release in self.releases:
+            release_url = f"{base}/repos/{self.owner}/{self.repo}/releases/{release['id']}"
+            assets = [
+                {**asset, 'url': f"{release_url}/assets/{asset['id']}", 'browser_download_url': f"{base}/download/{asset['name']}"}
+                for asset in release['assets']
+            ]
+            releases.append({**release, 'url': release_url, 'assets': assets})
+        return releases
+
+    def _handler(self):
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, data, link: str = None):
+                body = json.dumps(data).encode()
+                etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+                if self.headers.get('If-None-Match') == etag:
+                    self.send_response(304)
+                    self.send_header('ETag', etag)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.send_header('ETag', etag)
+                if link:
+                    self.send_header('Link', link)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _send_file(self, path: Path):
+                size = path.stat().st_size
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/vnd.debian.binary-package')
+                self.send_header('Content-Length', str(size))
+                self.end_headers()
+                with open(path, 'rb') as f:
+                    shutil.copyfileobj(f, self.wfile, 256 * 1024)
+                with standin._lock:
+                    standin.bytes_served += size
+
+            def do_GET(self):
+                with standin._lock:
+                    standin.requests += 1
+
+                parsed = urlparse(self.path)
+                query = parse_qs(parsed.query)
+                base = f"http://{self.headers.get('Host')}"
+                repo_path = f"/repos/{standin.owner}/{standin.repo}"
+                releases = standin._releases_json(base)
+
+                if parsed.path.startswith('/download/'):
+                    path = standin.files.get(os.path.basename(parsed.path))
+                    if path:
+                        return self._send_file(path)
+                elif parsed.path == repo_path:
+                    return self._send_json({
+                        'id': 1,
+                        'name': standin.repo,
+                        'full_name': f"{standin.owner}/{standin.repo}",
+                        'url': f"{base}{repo_path}",
+                        'owner': {'login': standin.owner},
+                    })
+                elif parsed.path == f"{repo_path}/releases":
+                    per_page = int(query.get('per_page', ['30'])[0])
+                    page = int(query.get('page', ['1'])[0])
+                    start = (page - 1) * per_page
+                    link = None
+                    if start + per_page < len(releases):
+                        link = f'<{base}{repo_path}/releases?per_page={per_page}&page={page + 1}>; rel="next"'
+                    return self._send_json(releases[start:start + per_page], link)
+                elif parsed.path.startswith(f"{repo_path}/releases/") and parsed.path.endswith('/assets'):
+                    release_id = int(parsed.path.split('/')[-2])
+                    for release in releases:
+                        if release['id'] == release_id:
+                            return self._send_json(release['assets'])
+
+                self.send_response(404)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+        return Handler
+
+    def start(self) -> 'GitHubStandIn':
+        self._thread = Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> 'GitHubStandIn':
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+
+class _LocalPaginator:
+    def __init__(self, client: 'LocalS3Client'):
+        self.client = client
+
+    def paginate(self, Bucket: str, Prefix: str = ""):
+        root = self.client._bucket_dir(Bucket)
+        contents = []
+        for path in sorted(root.rglob('*')):
+            key = path.relative_to(root).as_posix()
+            if path.is_file() and key.startswith(Prefix):
+                stat = path.stat()
+                contents.append({
+                    'Key': key,
+                    'Size': stat.st_size,
+                    'ETag': f'"{self.client._etags.get((Bucket, key), "")}"',
+                    'LastModified': datetime.fromtimestamp(stat.st_mtime, tz=timezone.utc),
+                })
+        for i in range(0, max(len(contents), 1), 1000):
+            yield {'Contents': contents[i:i + 1000]}
+
+
+class LocalS3Client:
+    """
+    Filesystem-backed replacement for the boto3 S3 client calls S3StorageService makes.
+
+    Used when moto is not installed. Objects are plain files under root; ETags
+    are computed as S3 computes them for single-part and multipart uploads,
+    with upload_file splitting files into parts as s3transfer would.
+    """
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self._etags: Dict[tuple, str] = {}
+        self._uploads: Dict[str, Dict[int, bytes]] = {}
+        self._lock = Lock()
+
+    def _bucket_dir(self, bucket: str) -> Path:
+        path = self.root / bucket
+        path.mkdir(parents=True, exist_ok=True)
+        return path
+
+    def upload_file(self, Filename: str, Bucket: str, Key: str, ExtraArgs: dict = None, Config=None):
+        # Split into parts exactly as s3transfer does, so large files get the multipart ETag
+        config = Config or TransferConfig()
+        size = os.path.getsize(Filename)
+        multipart = size >= config.multipart_threshold
+        chunksize = ChunksizeAdjuster().adjust_chunksize(config.multipart_chunksize, size) if multipart else 1024 * 1024
+        target = self._bucket_dir(Bucket) / Key
+        target.parent.mkdir(parents=True, exist_ok=True)
+        md5 = hashlib.md5()
+        part_digests = []
+        with open(Filename, 'rb') as src, open(target, 'wb') as dst:
+            for chunk in iter(lambda: src.read(chunksize), b''):
+                md5.update(chunk)
+                part_digests.append(hashlib.md5(chunk).digest())
+                dst.write(chunk)
+        if multipart:
+            etag = f"{hashlib.md5(b''.join(part_digests)).hexdigest()}-{len(part_digests)}"
+        else:
+            etag = md5.hexdigest()
+        with self._lock:
+            self._etags[(Bucket, Key)] = etag
+
+    def _write(self, bucket: str, key: str, data: bytes, etag: str) -> None:
+        target = self._bucket_dir(bucket) / key
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.write_bytes(data)
+        with self._lock:
+            self._etags[(bucket, key)] = etag
+
+    def put_object(self, Bucket: str, Key: str, Body: bytes, **kwargs):
+        self._write(Bucket, Key, Body, hashlib.md5(Body).hexdigest())
+        return {}
+
+    def create_multipart_upload(self, Bucket: str, Key: str, **kwargs):
+        upload_id = os.urandom(8).hex()
+        with self._lock:
+            self._uploads[upload_id] = {}
+        return {'UploadId': upload_id}
+
+    def upload_part(self, Bucket: str, Key: str, UploadId: str, PartNumber: int, Body: bytes):
+        with self._lock:
+            self._uploads[UploadId][PartNumber] = Body
+        return {'ETag': f'"{hashlib.md5(Body).hexdigest()}"'}
+
+    def complete_multipart_upload(self, Bucket: str, Key: str, UploadId: str, MultipartUpload: dict):
+        with self._lock:
+            parts = self._uploads.pop(UploadId)
+        data = [parts[part['PartNumber']] for part in MultipartUpload['Parts']]
+        digests = b''.join(hashlib.md5(part).digest() for part in data)
+        self._write(Bucket, Key, b''.join(data), f"{hashlib.md5(digests).hexdigest()}-{len(data)}")
+        return {}
+
+    def abort_multipart_upload(self, Bucket: str, Key: str, UploadId: str):
+        with self._lock:
+            self._uploads.pop(UploadId, None)
+        return {}
+
+    def get_object(self, Bucket: str, Key: str):
+        path = self._bucket_dir(Bucket) / Key
+        if not path.is_file():
+            raise ClientError({'Error': {'Code': 'NoSuchKey', 'Message': Key}}, 'GetObject')
+        return {'Body': io.BytesIO(path.read_bytes()), 'ContentLength': path.stat().st_size}
+
+    def get_paginator(self, operation: str) -> _LocalPaginator:
+        if operation != 'list_objects_v2':
+            raise NotImplementedError(operation)
+        return _LocalPaginator(self)
+
+    def delete_objects(self, Bucket: str, Delete: dict):
+        for obj in Delete.get('Objects', []):
+            path = self._bucket_dir(Bucket) / obj['Key']
+            if path.exists():
+                path.unlink()
+            with self._lock:
+                self._etags.pop((Bucket, obj['Key']), None)
+        return {}
+
+
+@contextmanager
+def s3_backend(workdir: Path, backend: str = "auto") -> Iterator[str]:
+    """
+    Provide an S3 endpoint for S3StorageService for the duration of the block.
+
+    Args:
+        workdir: Scratch directory for the local backend
+        backend: 'moto', 'local' or 'auto' (moto when installed)
+
+    Yields:
+        Name of the backend in use. With 'local', callers must replace the
+        storage service's client with make_local_client(workdir).
+    """
+    if backend in ("auto", "moto"):
+        try:
+            from moto import mock_aws
+        except ImportError:
+            if backend == "moto":
+                raise
+        else:
+            with mock_aws():
+                import boto3
+                boto3.client('s3', region_name='us-east-1').create_bucket(Bucket=BUCKET)
+                yield "moto"
+            return
+
+    yield "local"
+
+
+def make_local_client(workdir: Path) -> LocalS3Client:
+    return LocalS3Client(workdir / "s3")
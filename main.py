@@ -3,21 +3,26 @@
 import os
 import sys
 import tempfile
-import requests
 import json
 import shutil
 import subprocess
+from datetime import datetime, timezone
 from typing import Dict, List
 from github import Github
-from debian import debfile
+from debian import deb822
 from pathlib import Path
-from pydpkg import Dpkg
+from nplb.core.compression import EXTENSIONS, compress_file
+from nplb.core.deb import read_control
+from nplb.core.hashing import FileDigest, format_release_checksums, hash_file, hash_files
+from nplb.services.download import DownloadManager, DownloadTask, download_file as fetch_file
+from nplb.services.index import PackageIndex, file_fingerprint, write_by_hash, write_stanzas
+from nplb.services.signing import load_signer
 
-def get_github_releases(owner: str, repo: str) -> List[Dict]:
+def get_github_releases(owner: str, repo: str, api_url: str = "https://api.github.com") -> List[Dict]:
     """
     Fetch all releases for a given GitHub repository
     """
-    gh = Github(os.getenv("GITHUB_TOKEN"))
+    gh = Github(os.getenv("GITHUB_TOKEN"), base_url=api_url)
     repo = gh.get_repo(f"{owner}/{repo}")
     releases = []
     
@@ -45,8 +50,7 @@ def extract_deb_info(deb_path: str) -> Dict:
     """
     Extract package information from a .deb file
     """
-    deb = debfile.DebFile(deb_path)
-    control = deb.control.debcontrol()
+    control = deb822.Deb822(read_control(deb_path))
     
     return {
         'package': control.get('Package', ''),
@@ -56,19 +60,14 @@ def extract_deb_info(deb_path: str) -> Dict:
         'description': control.get('Description', '')
     }
 
-def download_file(url: str, target_path: str):
+def download_file(url: str, target_path: str, size: int = None):
     """
-    Download a file from URL to target path
+    Download a file from URL to target path, resuming and retrying interrupted transfers
     """
-    response = requests.get(url, stream=True)
-    response.raise_for_status()
-    
-    with open(target_path, 'wb') as f:
-        for chunk in response.iter_content(chunk_size=8192):
-            f.write(chunk)
+    fetch_file(url, target_path, size)
 
 class AptRepoGenerator:
-    def __init__(self, output_dir: str, repo_name: str, base_url: str, codename: str = "stable", architectures: List[str] = None):
+    def __init__(self, output_dir: str, repo_name: str, base_url: str, codename: str = "stable", architectures: List[str] = None, index_path: str = None, compression_formats: List[str] = None, compression_levels: Dict[str, int] = None, by_hash_retention: int = 3):
         self.output_dir = Path(output_dir)
         self.repo_name = repo_name
         self.base_url = base_url
@@ -76,7 +75,14 @@ class AptRepoGenerator:
         self.architectures = architectures or ["amd64", "arm64"]
         self.pool_dir = self.output_dir / "pool"
         self.dists_dir = self.output_dir / "dists" / self.codename
-        self.gpg_key = None
+        self.signer = None
+        # Persisted stanzas so unchanged pool files are not parsed again
+        self.index_path = Path(index_path) if index_path else self.output_dir / ".packages-index.json"
+        self.compression_formats = compression_formats or ["gz", "xz"]
+        self.compression_levels = compression_levels or {}
+        self.by_hash_retention = by_hash_retention
+        # Checksums of packages added this run, keyed by pool filename
+        self.digests: Dict[str, FileDigest] = {}
 
     def init_repository(self):
         """Initialize repository directory structure"""
@@ -152,29 +158,26 @@ Expire-Date: 0
                 finally:
                     os.unlink(temp_config.name)
         
-        # Import the private key for signing
-        subprocess.run([
-            "gpg", "--import", str(private_key)
-        ], check=True)
+        # Load the private key in-process once; signing needs no keyring import
+        self.signer = load_signer(str(private_key), "repo@example.com")
         
         # Copy public key to build directory
         shutil.copy2(public_key, self.output_dir / "key.gpg")
 
-    def add_package(self, deb_path: str):
-        """Add a package to the repository"""
+    def add_package(self, deb_path: str, digest: FileDigest = None):
+        """Add a package to the repository, with its checksums when already known"""
         # Copy package to pool
         deb_name = os.path.basename(deb_path)
         shutil.copy2(deb_path, self.pool_dir / deb_name)
+        if digest:
+            self.digests[deb_name] = digest
 
     def _generate_release_file(self):
         """Generate the Release file with required fields"""
         release_path = self.dists_dir / "Release"
         
         # Get current time in exact format APT expects
-        date = subprocess.check_output(
-            ['date', '-u', '+%a, %d %b %Y %H:%M:%S UTC'],
-            encoding='utf-8'
-        ).strip()
+        date = datetime.now(timezone.utc).strftime('%a, %d %b %Y %H:%M:%S UTC')
         
         release_content = f"""Origin: {self.repo_name}
 Label: {self.repo_name}
@@ -185,38 +188,22 @@ Architectures: {' '.join(self.architectures)}
 Components: main
 Description: GitHub Release Repository for {self.repo_name}"""
         
-        # Collect all hash entries first
-        sections = []
-        hash_commands = {
-            'MD5Sum': 'md5sum',
-            'SHA1': 'sha1sum',
-            'SHA256': 'sha256sum'
-        }
-        
-        for hash_name in ['MD5Sum', 'SHA1', 'SHA256']:
-            entries = []
-            for component in ['main']:
-                for arch in sorted(self.architectures):
-                    for filename in [
-                        f"{component}/binary-{arch}/Packages",
-                        f"{component}/binary-{arch}/Packages.gz",
-                        f"{component}/binary-{arch}/Packages.xz"
-                    ]:
-                        filepath = self.dists_dir / filename
-                        if filepath.exists():
-                            size = filepath.stat().st_size
-                            checksum = subprocess.check_output(
-                                [hash_commands[hash_name], str(filepath)],
-                                encoding='utf-8'
-                            ).split()[0]
-                            entries.append(f" {checksum} {size:12d} {filename}")
-            
-            if entries:
-                sections.append(f"{hash_name}:\n" + "\n".join(entries))
+        # Hash every index file once for all three checksum fields
+        filenames = [
+            filename
+            for component in ['main']
+            for arch in sorted(self.architectures)
+            for filename in [f"{component}/binary-{arch}/Packages"] + [
+                f"{component}/binary-{arch}/Packages{EXTENSIONS[fmt]}"
+                for fmt in self.compression_formats
+            ]
+            if (self.dists_dir / filename).exists()
+        ]
+        digests = dict(zip(filenames, hash_files(self.dists_dir / filename for filename in filenames)))
         
-        # Join all sections with single newlines
-        if sections:
-            release_content += "\n" + "\n".join(sections)
+        checksums = format_release_checksums(digests)
+        if checksums:
+            release_content += "\n" + checksums.rstrip("\n")
         
         release_content += "\nAcquire-By-Hash: yes\n"
         
@@ -224,79 +211,98 @@ Description: GitHub Release Repository for {self.repo_name}"""
         with open(release_path, 'w', encoding='utf-8') as f:
             f.write(release_content)
         
-        # Generate InRelease (signed Release)
-        subprocess.run([
-            'gpg', '--default-key', 'repo@example.com',
-            '--clearsign', '--armor', '--yes',
-            '--output', str(self.dists_dir / 'InRelease'),
-            str(release_path)
-        ], check=True)
+        # Generate InRelease (clearsigned) and Release.gpg (detached) from one signature
+        self.signer.sign_release(release_path)
+
+    def _build_stanza(self, deb_file: Path, digest: FileDigest = None) -> str:
+        """Build the Packages stanza for a pool file"""
+        # Only the control member is decompressed; the rest of the package is just hashed
+        control = deb822.Deb822(read_control(deb_file, use_mmap=True))
+        digest = digest or hash_file(deb_file)
+        print(f"Adding package: {control.get('Package')} version {control.get('Version')} ({control.get('Architecture')})")
+        
+        # Package info in debian control file format
+        lines = [
+            f"Package: {control.get('Package', '')}",
+            f"Version: {control.get('Version', '')}",
+            f"Architecture: {control.get('Architecture', '')}",
+            f"Maintainer: {control.get('Maintainer', '')}",
+        ]
+        if control.get('Depends'):
+            lines.append(f"Depends: {control['Depends']}")
+        lines.extend([
+            f"Filename: pool/{deb_file.name}",
+            f"Size: {digest.size}",
+            f"MD5sum: {digest.md5}",
+            f"SHA1: {digest.sha1}",
+            f"SHA256: {digest.sha256}",
+        ])
+        if control.get('Section'):
+            lines.append(f"Section: {control['Section']}")
+        if control.get('Description'):
+            lines.append(f"Description: {control['Description']}")
+        return "\n".join(lines)
+
+    def _update_index(self) -> PackageIndex:
+        """Bring the persisted package index in line with the pool"""
+        index = PackageIndex(self.index_path)
+        pool_files = sorted(self.pool_dir.glob('*.deb'))
+        
+        updated = 0
+        for deb_file in pool_files:
+            # Packages are downloaded and copied again every run, so a new mtime
+            # says nothing; the checksum from the download identifies the contents
+            digest = self.digests.get(deb_file.name)
+            updated += index.update(
+                deb_file.name,
+                digest.sha256 if digest else file_fingerprint(deb_file),
+                lambda: self._build_stanza(deb_file, digest)
+            )
+        removed = index.retain(deb_file.name for deb_file in pool_files)
         
-        # Generate Release.gpg (detached signature)
-        subprocess.run([
-            'gpg', '--default-key', 'repo@example.com',
-            '--detach-sign', '--armor', '--yes',
-            '--output', str(release_path) + '.gpg',
-            str(release_path)
-        ], check=True)
+        print(f"Indexed {len(index)} packages ({updated} updated, {len(removed)} removed)")
+        return index
 
     def generate_metadata(self):
         """Generate repository metadata files"""
-        for arch in self.architectures:
+        index = self._update_index()
+        changed = index.changed
+        index.save()
+        
+        # Every stanza for every architecture from one scan of the index
+        buckets = index.by_architecture(self.architectures)
+        
+        regenerated = False
+        for arch, stanzas in buckets.items():
             packages_dir = self.dists_dir / "main" / f"binary-{arch}"
             packages_path = packages_dir / "Packages"
+            outputs = [packages_path] + [
+                packages_dir / f"Packages{EXTENSIONS[fmt]}" for fmt in self.compression_formats
+            ]
+            
+            # Nothing was added or removed, so the existing indices are current
+            if not changed and all(path.exists() for path in outputs):
+                print(f"Architecture {arch} is up to date")
+                continue
             
             print(f"Processing architecture: {arch}")
-            # Generate Packages file using pydpkg
-            with open(packages_path, 'w', encoding='utf-8') as f:
-                package_count = 0
-                # Scan pool directory for .deb files
-                for deb_file in self.pool_dir.glob('*.deb'):
-                    pkg = Dpkg(str(deb_file))
-                    print(f"Found package: {pkg.package} ({pkg.architecture})")
-                    
-                    # Skip if architecture doesn't match (unless it's 'all')
-                    if pkg.architecture != arch and pkg.architecture != 'all':
-                        print(f"Skipping {deb_file.name} - wrong architecture")
-                        continue
-                    
-                    package_count += 1
-                    print(f"Adding package: {pkg.package} version {pkg.version}")
-                    # Write package info in debian control file format
-                    f.write(f"Package: {pkg.package}\n")
-                    f.write(f"Version: {pkg.version}\n")
-                    f.write(f"Architecture: {pkg.architecture}\n")
-                    f.write(f"Maintainer: {pkg.maintainer}\n")
-                    if pkg.depends:
-                        f.write(f"Depends: {pkg.depends}\n")
-                    f.write(f"Filename: pool/{deb_file.name}\n")
-                    f.write(f"Size: {deb_file.stat().st_size}\n")
-                    f.write(f"MD5sum: {pkg.md5}\n")
-                    f.write(f"SHA1: {pkg.sha1}\n")
-                    f.write(f"SHA256: {pkg.sha256}\n")
-                    if pkg.section:
-                        f.write(f"Section: {pkg.section}\n")
-                    if pkg.description:
-                        f.write(f"Description: {pkg.description}\n")
-                    f.write("\n")
-                
-                print(f"Added {package_count} packages for {arch}")
+            package_count = write_stanzas(packages_path, stanzas)
+            print(f"Added {package_count} packages for {arch}")
+            regenerated = True
 
-            # Generate compressed versions
-            # Gzip
-            subprocess.run([
-                "gzip", "-k", "-f", "-9",
-                str(packages_path)
-            ], check=True)
+            # Generate compressed versions from a single read of Packages
+            compressed_paths = compress_file(
+                packages_path,
+                formats=self.compression_formats,
+                levels=self.compression_levels
+            )
             
-            # XZ
-            subprocess.run([
-                "xz", "-k", "-f", "-9",
-                str(packages_path)
-            ], check=True)
+            # Content-addressed copies backing Acquire-By-Hash
+            write_by_hash([packages_path] + compressed_paths, self.by_hash_retention)
 
         # Generate Release files
-        self._generate_release_file()
+        if regenerated or not (self.dists_dir / "Release").exists():
+            self._generate_release_file()
 
 def process_repository(owner: str, repo: str, output_dir: str):
     """Process a GitHub repository and create APT repository"""
@@ -304,23 +310,41 @@ def process_repository(owner: str, repo: str, output_dir: str):
     repo_gen = AptRepoGenerator(
         output_dir=output_dir,
         repo_name=f"{owner}/{repo}",
-        base_url="https://nplb.wastelandsystems.io"
+        base_url="https://nplb.wastelandsystems.io",
+        compression_formats=os.getenv("NPLB_COMPRESSION_FORMATS", "gz,xz").split(",")
     )
     repo_gen.init_repository()
     
+    manager = DownloadManager(
+        max_workers=int(os.getenv("NPLB_DOWNLOAD_CONCURRENCY", "8")),
+        per_host_limit=int(os.getenv("NPLB_DOWNLOAD_PER_HOST_LIMIT", "4"))
+    )
+    
     with tempfile.TemporaryDirectory() as temp_dir:
-        for release in releases:
-            for asset in release['assets']:
-                temp_deb_path = os.path.join(temp_dir, asset['name'])
-                try:
-                    download_file(asset['download_url'], temp_deb_path)
-                    package_info = extract_deb_info(temp_deb_path)
-                    repo_gen.add_package(temp_deb_path)
-                except Exception as e:
-                    print(f"Error processing {asset['name']}: {str(e)}", file=sys.stderr)
-                finally:
-                    if os.path.exists(temp_deb_path):
-                        os.remove(temp_deb_path)
+        tasks = [
+            DownloadTask(
+                name=asset['name'],
+                url=asset['download_url'],
+                dest_path=os.path.join(temp_dir, asset['name']),
+                size=asset['size']
+            )
+            for release in releases
+            for asset in release['assets']
+        ]
+        
+        # Download all assets concurrently, then add them to the pool
+        for result in manager.download_all(tasks):
+            temp_deb_path = result.task.dest_path
+            try:
+                if not result.ok:
+                    raise result.error
+                package_info = extract_deb_info(temp_deb_path)
+                repo_gen.add_package(temp_deb_path, result.digest)
+            except Exception as e:
+                print(f"Error processing {result.task.name}: {str(e)}", file=sys.stderr)
+            finally:
+                if os.path.exists(temp_deb_path):
+                    os.remove(temp_deb_path)
     
     repo_gen.generate_metadata()
 
@@ -1,48 +1,193 @@
+import asyncio
+import hashlib
+import json
 from fastapi import APIRouter, Depends, HTTPException
-from ...core.config import get_settings, Settings
-from ...services.github import GitHubService
-from ...services.repository import RepositoryService
-from ...core.models import RepositoryResponse
+from fastapi.responses import StreamingResponse
+from ...resources.progress import TERMINAL_STAGES, progress_channel, progress_history_key
+from ...resources.queue import ACTIVE_STATUSES, QueueManager, get_queue_manager
+from ...core.models import BatchBuildRequest, BatchBuildResponse, JobStatusResponse, RepositoryResponse
 from loguru import logger
-from ...tasks.build import build_repository_task
+from ...tasks.build import aggregate_repositories_task, build_repository_task
 from ...tasks.exceptions import BuildRepositoryError
-from rq import Queue
-from rq.job import Job
-from redis import Redis
+from rq.exceptions import InvalidJobOperation, NoSuchJobError
+from rq.job import Dependency, Job
 
 router = APIRouter()
 
+def _build_job_key(owner: str, repo: str, limit: int, index_only: bool = False) -> str:
+    """
+    Deterministic identity of a build, so identical requests share one job.
+    
+    Computed without contacting GitHub. Requests coalesce until the job has
+    fetched the release list; the job then releases the key, so later
+    requests, which may follow a new release, are built again. Those find
+    an unchanged release list by its fingerprint and skip the rebuild.
+    """
+    return f"build:{owner}/{repo}:{limit}{':index-only' if index_only else ''}"
+
 @router.post("/build")
-def build_repository(
+async def build_repository(
     owner: str,
     repo: str,
     limit: int = 1,
-    settings: Settings = Depends(get_settings),
+    index_only: bool = False,
+    queue_manager: QueueManager = Depends(get_queue_manager),
 ):
-    # TODO: Use proper dependency injection
-    q = Queue(connection=Redis(settings.redis_host, settings.redis_port, settings.redis_password, settings.redis_db))
-    logger.info("Getting queue")
+    """
+    Build a repository from its latest releases.
+    
+    With index_only, the packages are assumed to be in the published pool
+    already; they are streamed to rebuild the indices without being
+    stored or uploaded.
+    """
     try:
-        logger.info("Creating GitHub service")
-        github_service = GitHubService(settings.github_token)
-        logger.info("Creating Repository service")
-        repo_service = RepositoryService(
-            repo_name=f"{owner}/{repo}",
-            base_url=settings.storage_url,
-        )
         logger.info("Enqueuing job")
-        job = q.enqueue(build_repository_task, owner, repo, limit, github_service, repo_service)
-        logger.info("Building repository")
-        logger.info("Repository built")
+        job, coalesced = await queue_manager.enqueue_unique_async(
+            _build_job_key(owner, repo, limit, index_only),
+            build_repository_task, owner, repo, limit,
+            kwargs={'index_only': index_only}
+        )
         return RepositoryResponse(
             status="success",
-            message=f"Job {owner}/{repo} queued",
+            message=f"Job {owner}/{repo} {'already queued' if coalesced else 'queued'}",
             job_id=job.id
         )
     except BuildRepositoryError as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/build/batch")
+async def build_repositories(
+    request: BatchBuildRequest,
+    queue_manager: QueueManager = Depends(get_queue_manager),
+):
+    """
+    Build many repositories in parallel and publish one combined index.
+    
+    Each repository is built by its own job. An aggregation job runs once
+    they have all finished, reads back the index each repository published,
+    merges them into a single dists/stable and signs it.
+    """
+    repositories = list(dict.fromkeys(f"{spec.owner}/{spec.repo}" for spec in request.repositories))
+    if not repositories:
+        raise HTTPException(status_code=400, detail="No repositories given")
     
+    try:
+        jobs = []
+        for repository in repositories:
+            owner, repo = repository.split('/', 1)
+            job, _ = await queue_manager.enqueue_unique_async(
+                _build_job_key(owner, repo, request.limit, request.index_only),
+                build_repository_task, owner, repo, request.limit,
+                kwargs={'index_only': request.index_only}
+            )
+            jobs.append(job)
+        logger.info(f"Enqueued {len(jobs)} build jobs")
+        
+        # Members whose build failed are aggregated from their last published index
+        # Identical batches coalesce into the same build jobs, and so into one aggregation
+        aggregate_key = hashlib.sha256(" ".join(sorted(job.id for job in jobs)).encode()).hexdigest()[:16]
+        aggregate_job, _ = await queue_manager.enqueue_unique_async(
+            f"aggregate:{aggregate_key}",
+            aggregate_repositories_task,
+            repositories,
+            depends_on=Dependency(jobs=jobs, allow_failure=True)
+        )
+        
+        return BatchBuildResponse(
+            status="success",
+            message=f"{len(jobs)} jobs queued",
+            job_ids=[job.id for job in jobs],
+            aggregate_job_id=aggregate_job.id
+        )
+    except BuildRepositoryError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+def _fetch_job(queue_manager: QueueManager, job_id: str) -> Job:
+    try:
+        return Job.fetch(job_id, connection=queue_manager.redis)
+    except NoSuchJobError:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+
+def _job_status(queue_manager: QueueManager, job_id: str) -> str:
+    """Current status of a job; 'expired' once it has expired or been deleted"""
+    try:
+        return Job.fetch(job_id, connection=queue_manager.redis).get_status()
+    except (NoSuchJobError, InvalidJobOperation):
+        return 'expired'
 
-def get_job(job_id: str):
-    job = Job.fetch(job_id, connection=Redis())
-    return job.result
\ No newline at end of file
+def _format_event(event: dict) -> str:
+    """Server-Sent Events frame for a progress event"""
+    lines = [f"event: {event['stage']}"]
+    if 'seq' in event:
+        lines.append(f"id: {event['seq']}")
+    lines.append(f"data: {json.dumps(event)}")
+    return "\n".join(lines) + "\n\n"
+
+async def _progress_events(queue_manager: QueueManager, job_id: str, heartbeat: float = 15.0):
+    """Replay a job's progress history, then follow live events until the job ends"""
+    redis = queue_manager.async_redis
+    pubsub = redis.pubsub()
+    try:
+        # Subscribe before reading the history so no event falls in between
+        await pubsub.subscribe(progress_channel(job_id))
+        
+        last_seq = 0
+        for payload in await redis.lrange(progress_history_key(job_id), 0, -1):
+            event = json.loads(payload)
+            last_seq = event['seq']
+            yield _format_event(event)
+            if event['stage'] in TERMINAL_STAGES:
+                return
+        
+        while True:
+            message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=heartbeat)
+            if message is None:
+                # Jobs that end without reporting (e.g. a killed worker) or
+                # expire while being followed end the stream too
+                status = await asyncio.to_thread(_job_status, queue_manager, job_id)
+                if status not in ACTIVE_STATUSES:
+                    yield _format_event({'stage': 'status', 'status': status})
+                    return
+                yield ": keep-alive\n\n"
+                continue
+            
+            event = json.loads(message['data'])
+            if event['seq'] <= last_seq:
+                continue
+            last_seq = event['seq']
+            yield _format_event(event)
+            if event['stage'] in TERMINAL_STAGES:
+                return
+    finally:
+        await pubsub.aclose()
+
+@router.get("/jobs/{job_id}", response_model=JobStatusResponse)
+def get_job(job_id: str, queue_manager: QueueManager = Depends(get_queue_manager)):
+    """Status of a build job and the progress it has reported so far"""
+    job = _fetch_job(queue_manager, job_id)
+    exc_info = job.exc_info
+    return JobStatusResponse(
+        job_id=job.id,
+        status=job.get_status(),
+        enqueued_at=job.enqueued_at,
+        started_at=job.started_at,
+        ended_at=job.ended_at,
+        error=exc_info.strip().splitlines()[-1] if exc_info else None,
+        progress=[json.loads(payload) for payload in queue_manager.redis.lrange(progress_history_key(job_id), 0, -1)]
+    )
+
+@router.get("/jobs/{job_id}/events")
+async def stream_job_events(job_id: str, queue_manager: QueueManager = Depends(get_queue_manager)):
+    """
+    Stream a job's progress as Server-Sent Events.
+    
+    Events reported before the client connected are replayed first. The
+    stream ends once the job finishes or fails, or with a status event if
+    the job ends without reporting or expires while being followed.
+    """
+    await asyncio.to_thread(_fetch_job, queue_manager, job_id)
+    return StreamingResponse(
+        _progress_events(queue_manager, job_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
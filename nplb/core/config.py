@@ -1,3 +1,4 @@
+import os
 from pydantic_settings import BaseSettings
 from functools import lru_cache
 
@@ -6,6 +7,8 @@ class Settings(BaseSettings):
     base_url: str = "https://nplb.wastelandsystems.io"
     output_dir: str = "build"
     default_codename: str = "stable"
+    architectures: list[str] = []  # Architectures to index; empty for every architecture in the pool
+    components: list[str] = ["main"]  # Components to index; packages go to the area of their Section
     
     # S3 Configuration
     aws_access_key_id: str
@@ -13,10 +16,37 @@ class Settings(BaseSettings):
     aws_bucket_name: str
     aws_region: str = "us-east-1"
     aws_public_url: str | None = None
+    upload_concurrency: int = 8  # Maximum S3 uploads in flight, shared by files and their multipart parts
+    multipart_chunksize: int = 8 * 1024 * 1024  # Part size for multipart uploads
+    direct_pool_upload: bool = True  # Stream release assets from GitHub straight into the S3 pool
+    stream_upload_buffers: int = 2  # Parts each streamed asset holds in memory, filling or uploading
+    # Streaming the pool holds up to download_concurrency x stream_upload_buffers x
+    # multipart_chunksize bytes of parts at once: 8 x 2 x 8 MiB = 128 MiB by default
     
     # GPG Configuration
     gpg_home: str = "keys"  # Default location for GPG keys
     gpg_key_email: str | None = None  # Email associated with signing key
+    gpg_passphrase: str | None = None  # Passphrase of the exported signing key, if protected
+
+    # Download Configuration
+    download_concurrency: int = 8  # Maximum number of assets downloaded at once
+    download_per_host_limit: int = 4  # Maximum concurrent connections per host
+    download_retries: int = 3  # Retries of an interrupted download, each resuming where it stopped
+    download_connect_timeout: float = 10.0  # Seconds to wait for a connection
+    download_read_timeout: float = 60.0  # Seconds to wait for data on an open connection
+    github_connect_timeout: float = 5.0  # Seconds to wait for a connection to the GitHub API
+    github_read_timeout: float = 15.0  # Seconds to wait for a GitHub API response
+    github_retries: int = 2  # Retries of a GitHub API request that timed out or failed with 5xx
+
+    # Cache Configuration
+    package_cache_path: str = "package_cache.sqlite"  # Parsed package metadata keyed by asset
+    index_dir: str = "indices"  # Persisted Packages indices, one per repository
+    github_cache_path: str = "github_cache.sqlite"  # ETags and bodies of GitHub API responses
+
+    # Compression Configuration
+    compression_formats: list[str] = ["gz", "xz"]  # Compressed Packages variants ("gz", "xz", "zst")
+    compression_levels: dict[str, int] = {}  # Per-format level overrides, e.g. {"xz": 9}
+    by_hash_retention: int = 3  # Generations of by-hash indices kept for clients mid-update
 
 
     # Redis Configuration
@@ -24,6 +54,15 @@ class Settings(BaseSettings):
     redis_port: int = 6379
     redis_password: str = ""
     redis_db: int = 0
+    redis_max_connections: int = 50  # Size of the connection pool shared by API requests
+    redis_pool_timeout: float = 5.0  # Seconds to wait for a free pooled connection
+
+    # Batch Build Configuration
+    combined_repo_name: str = "nplb"  # Origin/Label of the repository aggregating batch builds
+    
+    def index_path(self, owner: str, repo: str) -> str:
+        """Path of the persisted package index for a repository"""
+        return os.path.join(self.index_dir, f"{owner}_{repo}.json")
     
     @property
     def storage_url(self) -> str:
@@ -0,0 +1,177 @@
+from pathlib import Path
+from typing import Callable, Optional, Tuple
+import io
+import mmap
+import os
+import tarfile
+
+try:
+    import zstandard
+except ImportError:  # only needed for control.tar.zst members
+    zstandard = None
+
+AR_MAGIC = b"!<arch>\n"
+AR_HEADER_SIZE = 60
+
+
+class DebFormatError(ValueError):
+    pass
+
+
+def _parse_header(header: bytes) -> Tuple[str, int]:
+    """Name and size of the ar member described by a 60 byte header"""
+    if len(header) < AR_HEADER_SIZE or header[58:60] != b"`\n":
+        raise DebFormatError("Malformed ar member header")
+    try:
+        # GNU ar terminates names with '/'
+        name = header[:16].decode('ascii').rstrip().rstrip('/')
+        size = int(header[48:58].decode('ascii'))
+    except ValueError as e:
+        raise DebFormatError(f"Malformed ar member header: {str(e)}")
+    return name, size
+
+
+def is_control_member(name: str) -> bool:
+    return name == 'control.tar' or name.startswith('control.tar.')
+
+
+def control_from_member(name: str, data: bytes) -> str:
+    """
+    Decompress a control.tar member and return its control file.
+
+    Args:
+        name: ar member name, e.g. control.tar.xz
+        data: Raw member contents
+    """
+    fileobj: io.RawIOBase = io.BytesIO(data)
+    if name.endswith('.zst'):
+        if zstandard is None:
+            raise DebFormatError(f"{name} requires the zstandard package")
+        fileobj = zstandard.ZstdDecompressor().stream_reader(fileobj)
+
+    try:
+        # Stream mode: members are decompressed in order and only up to control
+        with tarfile.open(fileobj=fileobj, mode='r|*') as tar:
+            for info in tar:
+                if info.isfile() and os.path.normpath(info.name) == 'control':
+                    return tar.extractfile(info).read().decode('utf-8')
+    except (tarfile.TarError, EOFError, OSError) as e:
+        raise DebFormatError(f"Unreadable {name}: {str(e)}")
+    raise DebFormatError(f"{name} has no control file")
+
+
+def _find_control(read_at: Callable[[int, int], bytes]) -> str:
+    if read_at(0, len(AR_MAGIC)) != AR_MAGIC:
+        raise DebFormatError("Not a Debian binary package")
+
+    offset = len(AR_MAGIC)
+    while header := read_at(offset, AR_HEADER_SIZE):
+        name, size = _parse_header(header)
+        offset += AR_HEADER_SIZE
+        if is_control_member(name):
+            data = read_at(offset, size)
+            if len(data) < size:
+                raise DebFormatError(f"Truncated {name} member")
+            return control_from_member(name, data)
+        # Members are 2-byte aligned
+        offset += size + (size & 1)
+
+    raise DebFormatError("Package has no control.tar member")
+
+
+def read_control(path: str | Path, use_mmap: bool = False) -> str:
+    """
+    Read the control file of a .deb without unpacking the rest of it.
+
+    Only ar headers are read until the control.tar member is found, and
+    only that member is decompressed; data.tar is never touched.
+
+    Args:
+        path: Path of the package
+        use_mmap: Map the file instead of seeking and reading through it
+
+    Returns:
+        Contents of the control file
+
+    Raises:
+        DebFormatError: If the file is not a readable binary package
+    """
+    with open(path, 'rb') as f:
+        if use_mmap and os.fstat(f.fileno()).st_size:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                return _find_control(lambda offset, size: mapped[offset:offset + size])
+
+        def read_at(offset: int, size: int) -> bytes:
+            f.seek(offset)
+            return f.read(size)
+
+        return _find_control(read_at)
+
+
+class ControlReader:
+    """
+    Capture the control file of a .deb fed to it in chunks.
+
+    Parses the ar stream as it passes, e.g. while a package is downloaded:
+    members before control.tar are skipped without buffering, only the
+    control.tar member is held in memory, and everything after it is
+    ignored. Nothing is written to disk.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self) -> None:
+        """Start over with a new stream."""
+        self.control: Optional[str] = None
+        self._buffer = bytearray()
+        self._needed = len(AR_MAGIC)
+        self._skip = 0
+        self._member: Optional[str] = None
+        self._started = False
+
+    def feed(self, chunk: bytes) -> None:
+        view = memoryview(chunk)
+        while view and self.control is None:
+            if self._skip:
+                skipped = min(self._skip, len(view))
+                self._skip -= skipped
+                view = view[skipped:]
+                continue
+
+            taken = min(self._needed - len(self._buffer), len(view))
+            self._buffer += view[:taken]
+            view = view[taken:]
+            if len(self._buffer) == self._needed:
+                self._advance(bytes(self._buffer))
+                self._buffer.clear()
+
+    def _advance(self, data: bytes) -> None:
+        if not self._started:
+            if data != AR_MAGIC:
+                raise DebFormatError("Not a Debian binary package")
+            self._started = True
+            self._needed = AR_HEADER_SIZE
+        elif self._member is None:
+            name, size = _parse_header(data)
+            if is_control_member(name):
+                self._member = name
+                self._needed = size
+                if not size:
+                    self._advance(b"")
+            else:
+                # Members are 2-byte aligned
+                self._skip = size + (size & 1)
+        else:
+            self.control = control_from_member(self._member, data)
+
+    def result(self) -> str:
+        """
+        Control file of the stream fed so far.
+
+        Raises:
+            DebFormatError: If the stream ended before the control file
+        """
+        if self.control is None:
+            raise DebFormatError("Package has no control.tar member")
+        return self.control
@@ -0,0 +1,102 @@
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List
+import hashlib
+
+CHUNK_SIZE = 1024 * 1024
+
+# Checksum fields of a Release file and the FileDigest attribute each lists
+RELEASE_CHECKSUMS = (
+    ('MD5Sum', 'md5'),
+    ('SHA1', 'sha1'),
+    ('SHA256', 'sha256'),
+)
+
+
+@dataclass(frozen=True)
+class FileDigest:
+    size: int
+    md5: str
+    sha1: str
+    sha256: str
+
+
+class MultiHasher:
+    """Feed data once and compute every checksum APT indices need."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self) -> None:
+        """Discard everything fed so far."""
+        self.size = 0
+        self._md5 = hashlib.md5()
+        self._sha1 = hashlib.sha1()
+        self._sha256 = hashlib.sha256()
+
+    def update(self, chunk: bytes) -> None:
+        self.size += len(chunk)
+        self._md5.update(chunk)
+        self._sha1.update(chunk)
+        self._sha256.update(chunk)
+
+    def digest(self) -> FileDigest:
+        return FileDigest(
+            size=self.size,
+            md5=self._md5.hexdigest(),
+            sha1=self._sha1.hexdigest(),
+            sha256=self._sha256.hexdigest()
+        )
+
+
+def hash_file(path: str | Path, chunk_size: int = CHUNK_SIZE) -> FileDigest:
+    """Compute size and checksums of a file in a single chunked read."""
+    hasher = MultiHasher()
+    # One reused buffer rather than a new bytes object per chunk
+    buffer = bytearray(chunk_size)
+    view = memoryview(buffer)
+    with open(path, 'rb', buffering=0) as f:
+        while (read := f.readinto(buffer)):
+            hasher.update(view[:read])
+    return hasher.digest()
+
+
+def hash_files(paths: Iterable[str | Path], max_workers: int = 4) -> List[FileDigest]:
+    """
+    Hash several files concurrently.
+
+    hashlib releases the GIL while digesting large buffers, so files are
+    hashed in parallel threads.
+
+    Returns:
+        FileDigest of each path, in the order of paths
+    """
+    paths = list(paths)
+    if len(paths) <= 1:
+        return [hash_file(path) for path in paths]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(paths)), thread_name_prefix="hash") as executor:
+        return list(executor.map(hash_file, paths))
+
+
+def format_release_checksums(digests: Dict[str, FileDigest]) -> str:
+    """
+    Render the MD5Sum, SHA1 and SHA256 fields of a Release file.
+
+    Args:
+        digests: Digest of each index file keyed by its path relative to the Release file
+
+    Returns:
+        The three fields, entries sorted by path, or '' if digests is empty
+    """
+    if not digests:
+        return ''
+
+    sections = []
+    for field, attribute in RELEASE_CHECKSUMS:
+        entries = [
+            f" {getattr(digest, attribute)} {digest.size:12d} {path}"
+            for path, digest in sorted(digests.items())
+        ]
+        sections.append(f"{field}:\n" + "\n".join(entries))
+    return "\n".join(sections) + "\n"
@@ -0,0 +1,268 @@
+from contextlib import contextmanager
+from threading import Lock
+from typing import Dict, Iterable, Iterator, List, Sequence, Tuple
+import json
+import math
+import os
+import socket
+import time
+
+# Seconds; builds range from sub-second cache hits to multi-minute uploads
+DEFAULT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, math.inf)
+
+PUSH_KEY_PREFIX = "nplb:metrics:"
+
+LabelValues = Tuple[str, ...]
+# (sample name, labels, value)
+Sample = Tuple[str, Dict[str, str], float]
+
+
+class Registry:
+    """
+    Collection of metrics rendered together in the Prometheus text format.
+
+    Metrics only live in the process that records them. Worker processes
+    push snapshots of their registry to Redis (see push_metrics) and the
+    API merges them into its own on scrape (see collect_pushed).
+    """
+
+    def __init__(self):
+        self.metrics: Dict[str, 'Metric'] = {}
+
+    def register(self, metric: 'Metric') -> None:
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self.metrics[metric.name] = metric
+
+    def collect(self) -> Dict[str, dict]:
+        """
+        Snapshot every metric as JSON-serializable families.
+
+        Returns:
+            Mapping of metric name to {'type', 'help', 'samples'}
+        """
+        return {
+            name: {'type': metric.type, 'help': metric.documentation, 'samples': list(metric.samples())}
+            for name, metric in self.metrics.items()
+        }
+
+
+REGISTRY = Registry()
+
+
+class Metric:
+    type = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), registry: Registry = REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = Lock()
+        if registry is not None:
+            registry.register(self)
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _add(self, key: LabelValues, amount: float) -> None:
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self) -> Iterator[Sample]:
+        with self._lock:
+            values = dict(self._values)
+        for key, value in values.items():
+            yield self.name, dict(zip(self.labelnames, key)), value
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        if amount < 0:
+            raise ValueError("Counters can only increase")
+        self._add(self._key(labels), amount)
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = float(value)
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        self._add(self._key(labels), amount)
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self._add(self._key(labels), -amount)
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Iterable[float] = DEFAULT_BUCKETS,
+        registry: Registry = REGISTRY
+    ):
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(sorted(set(buckets) | {math.inf}))
+        # Per label set: (bucket counts, sum, count)
+        self._observations: Dict[LabelValues, Tuple[List[int], float, int]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            counts, total, count = self._observations.get(key) or ([0] * len(self.buckets), 0.0, 0)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._observations[key] = (counts, total + value, count + 1)
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the wall-clock duration of the block, even if it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self) -> Iterator[Sample]:
+        with self._lock:
+            observations = {key: (list(counts), total, count) for key, (counts, total, count) in self._observations.items()}
+        for key, (counts, total, count) in observations.items():
+            labels = dict(zip(self.labelnames, key))
+            for bound, bucket_count in zip(self.buckets, counts):
+                yield f"{self.name}_bucket", {**labels, 'le': _format_value(bound)}, bucket_count
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, count
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if value == -math.inf:
+        return '-Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def merge(*snapshots: Dict[str, dict]) -> Dict[str, dict]:
+    """
+    Merge registry snapshots by summing samples with identical name and labels.
+
+    Counters and histograms from several processes add up to the totals
+    across processes; gauges are summed too (e.g. jobs in progress).
+    """
+    merged: Dict[str, dict] = {}
+    for snapshot in snapshots:
+        for name, family in snapshot.items():
+            target = merged.setdefault(name, {'type': family['type'], 'help': family['help'], 'values': {}})
+            for sample_name, labels, value in family['samples']:
+                key = (sample_name, tuple(sorted(labels.items())))
+                target['values'][key] = target['values'].get(key, 0.0) + value
+
+    return {
+        name: {
+            'type': family['type'],
+            'help': family['help'],
+            'samples': [(sample_name, dict(labels), value) for (sample_name, labels), value in family['values'].items()]
+        }
+        for name, family in merged.items()
+    }
+
+
+def render(families: Dict[str, dict]) -> str:
+    """Render snapshot families in the Prometheus text exposition format (0.0.4)."""
+    lines = []
+    for name in sorted(families):
+        family = families[name]
+        lines.append(f"# HELP {name} {_escape(family['help'])}")
+        lines.append(f"# TYPE {name} {family['type']}")
+        for sample_name, labels, value in family['samples']:
+            if labels:
+                label_text = ",".join(f'{key}="{_escape(str(val))}"' for key, val in labels.items())
+                lines.append(f"{sample_name}{{{label_text}}} {_format_value(value)}")
+            else:
+                lines.append(f"{sample_name} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+def instance_id() -> str:
+    """Identity of this process among the ones pushing metrics."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def push_metrics(redis, registry: Registry = REGISTRY, ttl: int = 86400) -> None:
+    """
+    Publish a snapshot of registry to Redis for the API to serve.
+
+    Snapshots are cumulative, so the latest one per process is all the API
+    needs. They expire after ttl seconds so exited workers drop out.
+    """
+    redis.set(PUSH_KEY_PREFIX + instance_id(), json.dumps(registry.collect()), ex=ttl)
+
+
+def collect_pushed(redis) -> List[Dict[str, dict]]:
+    """Fetch the snapshots pushed by every live process."""
+    keys = list(redis.scan_iter(match=PUSH_KEY_PREFIX + "*"))
+    if not keys:
+        return []
+    return [json.loads(payload) for payload in redis.mget(keys) if payload]
+
+
+# Build metrics
+STAGE_SECONDS = Histogram(
+    "nplb_stage_duration_seconds",
+    "Time spent in each build stage",
+    ["stage"]
+)
+JOB_SECONDS = Histogram(
+    "nplb_job_duration_seconds",
+    "Time spent running build jobs",
+    ["task", "outcome"]
+)
+QUEUE_WAIT_SECONDS = Histogram(
+    "nplb_queue_wait_seconds",
+    "Time jobs waited in the queue before a worker started them",
+    ["task"]
+)
+TRANSFER_BYTES = Counter(
+    "nplb_transfer_bytes_total",
+    "Bytes transferred, by direction",
+    ["direction"]
+)
+DOWNLOAD_RETRIES = Counter(
+    "nplb_download_retries_total",
+    "Asset download attempts retried, by reason",
+    ["reason"]
+)
+CACHE_REQUESTS = Counter(
+    "nplb_cache_requests_total",
+    "Cache lookups, by cache and result",
+    ["cache", "result"]
+)
+
+# Queue metrics, refreshed from Redis by the API on every scrape
+QUEUE_JOBS = Gauge(
+    "nplb_queue_jobs",
+    "Jobs in the build queue, by state",
+    ["state"]
+)
+QUEUE_OLDEST_JOB_SECONDS = Gauge(
+    "nplb_queue_oldest_job_age_seconds",
+    "Age of the oldest job waiting in the build queue"
+)
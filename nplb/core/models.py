@@ -1,11 +1,13 @@
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 from datetime import datetime
 
 class DebAsset(BaseModel):
     name: str
     download_url: str
     size: int
+    id: Optional[int] = None
+    updated_at: Optional[datetime] = None
 
 class Release(BaseModel):
     tag_name: str
@@ -20,7 +22,31 @@ class DebInfo(BaseModel):
     depends: str
     description: str
 
+class RepositorySpec(BaseModel):
+    owner: str
+    repo: str
+
+class BatchBuildRequest(BaseModel):
+    repositories: List[RepositorySpec]
+    limit: int = 1
+    index_only: bool = False  # Pools are already published; only rebuild the indices
+
 class RepositoryResponse(BaseModel):
     status: str
     message: str
-    job_id: str
\ No newline at end of file
+    job_id: str
+
+class BatchBuildResponse(BaseModel):
+    status: str
+    message: str
+    job_ids: List[str]
+    aggregate_job_id: str
+
+class JobStatusResponse(BaseModel):
+    job_id: str
+    status: str
+    enqueued_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    ended_at: Optional[datetime] = None
+    error: Optional[str] = None
+    progress: List[Dict[str, Any]] = []
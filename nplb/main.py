@@ -1,24 +1,52 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
+from loguru import logger
+from redis.exceptions import RedisError
 from .api.routes import repositories
+from .core.metrics import REGISTRY, collect_pushed, merge, render
+from .resources.queue import get_queue_manager
+from .services.github import GitHubError, GitHubTimeoutError
 import uvicorn
-from requests_cache import DO_NOT_CACHE, get_cache, install_cache
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One Redis connection pool serves every request for the app's lifetime
+    queue_manager = get_queue_manager()
+    yield
+    await queue_manager.aclose()
 
 app = FastAPI(
     title="NPLB - APT Repository Generator",
     description="API for generating APT repositories from GitHub releases",
     version="1.0.0",
-    prefix="/api/v1"
+    prefix="/api/v1",
+    lifespan=lifespan
 )
 
 app.include_router(repositories.router, prefix="/repositories", tags=["repositories"])
 
-install_cache(
-    cache_control=True,
-    urls_expire_after={
-        '*.github.com': 360,  # Placeholder expiration; should be overridden by Cache-Control
-        '*': DO_NOT_CACHE,  # Don't cache anything other than GitHub requests
-    },
-)
+@app.exception_handler(GitHubError)
+async def github_error(request: Request, exc: GitHubError):
+    """GitHub failures are upstream failures, not ours"""
+    logger.warning(str(exc))
+    status_code = 504 if isinstance(exc, GitHubTimeoutError) else 502
+    return JSONResponse(status_code=status_code, content={"detail": str(exc)})
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Prometheus metrics of the API and every worker that pushed its metrics"""
+    queue_manager = get_queue_manager()
+    pushed = []
+    try:
+        queue_manager.record_queue_metrics()
+        pushed = collect_pushed(queue_manager.redis)
+    except RedisError as e:
+        logger.warning(f"Serving local metrics only: {str(e)}")
+    return PlainTextResponse(
+        render(merge(REGISTRY.collect(), *pushed)),
+        media_type="text/plain; version=0.0.4"
+    )
 
 if __name__ == "__main__":
     uvicorn.run("nplb.main:app", host="0.0.0.0", port=8080, reload=True)
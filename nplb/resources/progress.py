@@ -0,0 +1,97 @@
+from threading import Lock
+from typing import Dict, Optional
+import json
+import time
+from loguru import logger
+from redis import Redis
+from rq import get_current_job
+
+# Stages after which a job publishes nothing more
+TERMINAL_STAGES = ("finished", "failed")
+
+
+def progress_channel(job_id: str) -> str:
+    return f"nplb:progress:{job_id}"
+
+
+def progress_history_key(job_id: str) -> str:
+    return f"nplb:progress:{job_id}:history"
+
+
+def _progress_sequence_key(job_id: str) -> str:
+    return f"nplb:progress:{job_id}:seq"
+
+
+class ProgressReporter:
+    """
+    Publishes build progress events for a job over Redis pub/sub.
+
+    Every event is also appended to a per-job history list so clients that
+    subscribe late can replay what they missed. Events carry an increasing
+    seq number to deduplicate the replay against live messages.
+    """
+
+    def __init__(self, redis: Redis, job_id: str, history_ttl: int = 86400, min_interval: float = 0.5):
+        """
+        Initialize progress reporter.
+
+        Args:
+            redis: Connection events are published on
+            job_id: Job the events belong to
+            history_ttl: Seconds the event history is kept after the last event
+            min_interval: Minimum seconds between download events for one asset
+        """
+        self.redis = redis
+        self.job_id = job_id
+        self.history_ttl = history_ttl
+        self.min_interval = min_interval
+        self._last_download: Dict[str, float] = {}
+        self._lock = Lock()
+
+    @classmethod
+    def for_current_job(cls) -> Optional['ProgressReporter']:
+        """Reporter for the RQ job being executed, or None outside a worker."""
+        job = get_current_job()
+        if job is None:
+            return None
+        return cls(job.connection, job.id)
+
+    def report(self, stage: str, **data) -> None:
+        """
+        Publish a progress event.
+
+        Download events for one asset are throttled to min_interval; the
+        final chunk of an asset of known size is always published. Failures
+        are logged and swallowed; progress reporting never fails a build.
+
+        Args:
+            stage: Build stage the event describes
+            **data: JSON-serializable event details
+        """
+        if stage == "download" and self._throttled(data.get("asset"), data.get("bytes"), data.get("total")):
+            return
+
+        try:
+            seq = self.redis.incr(_progress_sequence_key(self.job_id))
+            payload = json.dumps({"seq": seq, "stage": stage, "time": time.time(), **data})
+
+            history_key = progress_history_key(self.job_id)
+            with self.redis.pipeline() as pipe:
+                pipe.rpush(history_key, payload)
+                pipe.expire(history_key, self.history_ttl)
+                pipe.expire(_progress_sequence_key(self.job_id), self.history_ttl)
+                pipe.publish(progress_channel(self.job_id), payload)
+                pipe.execute()
+        except Exception as e:
+            logger.warning(f"Failed to publish progress for job {self.job_id}: {str(e)}")
+
+    __call__ = report
+
+    def _throttled(self, asset: str, bytes_downloaded: Optional[int], total: Optional[int]) -> bool:
+        now = time.monotonic()
+        done = total is not None and bytes_downloaded is not None and bytes_downloaded >= total
+        with self._lock:
+            if not done and now - self._last_download.get(asset, float("-inf")) < self.min_interval:
+                return True
+            self._last_download[asset] = now
+        return False
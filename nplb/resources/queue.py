@@ -1,36 +1,213 @@
+import asyncio
+from datetime import timezone
 from rq import Queue
-from redis import Redis
-from typing import Annotated
-from fastapi import Depends, get_settings
+from rq.job import Job, JobStatus
+from rq.exceptions import NoSuchJobError
+from rq.utils import now
+from redis import BlockingConnectionPool, Redis
+from redis import asyncio as aioredis
+from redis.exceptions import WatchError
+from typing import Annotated, Callable, Optional, Tuple
+from fastapi import Depends
 from functools import lru_cache
+from loguru import logger
+from ..core.config import get_settings
+from ..core.metrics import QUEUE_JOBS, QUEUE_OLDEST_JOB_SECONDS
+
+# Jobs in these states will still do the work a duplicate request asks for
+ACTIVE_STATUSES = (JobStatus.QUEUED, JobStatus.STARTED, JobStatus.DEFERRED, JobStatus.SCHEDULED)
+
+
+def _dedup_key(key: str) -> str:
+    return f"nplb:dedup:{key}"
+
+
+def _fingerprint_key(key: str) -> str:
+    return f"nplb:fingerprint:{key}"
+
+
+def _delete_if_equal(redis: Redis, name: str, value: str) -> None:
+    """Delete name if it still holds value, leaving it alone if someone changed it meanwhile"""
+    with redis.pipeline() as pipe:
+        try:
+            pipe.watch(name)
+            current = pipe.get(name)
+            if current is not None and current.decode() == value:
+                pipe.multi()
+                pipe.delete(name)
+                pipe.execute()
+        except WatchError:
+            pass
+
+
+def release_job_key(job: Job) -> None:
+    """
+    Stop coalescing requests into a running job.
+
+    Called by a job once it has read the state its key stands for (e.g. the
+    release list); later requests may follow a change it did not see, so
+    they get a job of their own. The job itself keeps running.
+    """
+    key = job.meta.get('dedup_key')
+    if key:
+        _delete_if_equal(job.connection, _dedup_key(key), job.id)
+
+
+def last_fingerprint(job: Job) -> Optional[str]:
+    """Fingerprint a job with the same key recorded after completing its work"""
+    key = job.meta.get('dedup_key')
+    fingerprint = job.connection.get(_fingerprint_key(key)) if key else None
+    return fingerprint.decode() if fingerprint else None
+
+
+def record_fingerprint(job: Job, fingerprint: str, ttl: int = 3600) -> None:
+    """Remember what a job's completed work was based on, for ttl seconds"""
+    key = job.meta.get('dedup_key')
+    if key:
+        job.connection.set(_fingerprint_key(key), fingerprint, ex=ttl)
 
 
 class QueueManager:
-    def __init__(self, settings):
+    def __init__(self, settings, dedup_ttl: int = 3600):
         self.settings = settings
+        self.dedup_ttl = dedup_ttl
         self._queue = None
         self._redis = None
+        self._pool = None
+        self._async_redis = None
+
+    @property
+    def pool(self) -> BlockingConnectionPool:
+        # Shared by every request for the lifetime of the process; callers
+        # wait for a free connection under bursts instead of opening new ones
+        if self._pool is None:
+            self._pool = BlockingConnectionPool(
+                host=self.settings.redis_host,
+                port=self.settings.redis_port,
+                password=self.settings.redis_password,
+                db=self.settings.redis_db,
+                max_connections=self.settings.redis_max_connections,
+                timeout=self.settings.redis_pool_timeout
+            )
+        return self._pool
 
     @property
     def redis(self):
         if self._redis is None:
-            self._redis = Redis(
-                host=self.settings.REDIS_HOST,
-                port=self.settings.REDIS_PORT,
-                password=self.settings.REDIS_PASSWORD,
-                db=self.settings.REDIS_DB
-            )
+            self._redis = Redis(connection_pool=self.pool)
         return self._redis
 
+    @property
+    def async_redis(self) -> aioredis.Redis:
+        """Client for the event loop, e.g. for pub/sub subscriptions"""
+        if self._async_redis is None:
+            self._async_redis = aioredis.Redis(
+                connection_pool=aioredis.BlockingConnectionPool(
+                    host=self.settings.redis_host,
+                    port=self.settings.redis_port,
+                    password=self.settings.redis_password,
+                    db=self.settings.redis_db,
+                    max_connections=self.settings.redis_max_connections,
+                    timeout=self.settings.redis_pool_timeout
+                )
+            )
+        return self._async_redis
+
     @property
     def queue(self):
         if self._queue is None:
             self._queue = Queue(connection=self.redis)
         return self._queue
 
+    def _active_job(self, job_id: str) -> Optional[Job]:
+        try:
+            job = Job.fetch(job_id, connection=self.redis)
+        except NoSuchJobError:
+            return None
+        return job if job.get_status() in ACTIVE_STATUSES else None
+
+    def enqueue_unique(self, key: str, func: Callable, *args, **kwargs) -> Tuple[Job, bool]:
+        """
+        Enqueue a job unless an identical one is already queued or running.
+
+        Jobs are identified by key; while the job registered under a key is
+        active, further requests with the same key get that job back
+        instead of enqueuing duplicate work. The key is stored in the job's
+        meta, so the job can release it early with release_job_key.
+
+        Args:
+            key: Deterministic identity of the requested work
+            func: Job function
+            *args: Positional arguments for func
+            **kwargs: Keyword arguments for Queue.create_job
+
+        Returns:
+            Tuple of (job, coalesced) where coalesced is True if an existing job was returned
+        """
+        dedup_key = _dedup_key(key)
+
+        while True:
+            # Save the job before claiming the key so that anyone reading the
+            # key can always fetch the job it points to
+            job = self.queue.create_job(func, args=args, meta={'dedup_key': key}, **kwargs)
+            job.save()
+            if self.redis.set(dedup_key, job.id, nx=True, ex=self.dedup_ttl):
+                return self.queue.enqueue_job(job), False
+            job.delete()
+
+            existing_id = self.redis.get(dedup_key)
+            if existing_id is None:
+                continue
+
+            existing = self._active_job(existing_id.decode())
+            if existing:
+                logger.info(f"Coalescing request {key} into job {existing.id}")
+                return existing, True
+
+            # The registered job is done; release the key unless someone beat us to it
+            _delete_if_equal(self.redis, dedup_key, existing_id.decode())
+
+    def record_queue_metrics(self) -> None:
+        """Refresh the queue depth and latency gauges from Redis."""
+        queue = self.queue
+        QUEUE_JOBS.set(queue.count, state='queued')
+        QUEUE_JOBS.set(queue.started_job_registry.count, state='started')
+        QUEUE_JOBS.set(queue.deferred_job_registry.count, state='deferred')
+        QUEUE_JOBS.set(queue.scheduled_job_registry.count, state='scheduled')
+        QUEUE_JOBS.set(queue.failed_job_registry.count, state='failed')
+
+        oldest_age = 0.0
+        for job_id in queue.get_job_ids(0, 1):
+            job = Job.fetch(job_id, connection=self.redis)
+            if job.enqueued_at:
+                enqueued_at = job.enqueued_at
+                if enqueued_at.tzinfo is None:
+                    enqueued_at = enqueued_at.replace(tzinfo=timezone.utc)
+                oldest_age = (now() - enqueued_at).total_seconds()
+        QUEUE_OLDEST_JOB_SECONDS.set(max(oldest_age, 0.0))
+
+    async def enqueue_unique_async(self, key: str, func: Callable, *args, **kwargs) -> Tuple[Job, bool]:
+        """
+        Run enqueue_unique without blocking the event loop.
+
+        RQ only speaks synchronous Redis, so the enqueue runs in a worker
+        thread; its connections come from the shared pool.
+        """
+        return await asyncio.to_thread(self.enqueue_unique, key, func, *args, **kwargs)
+
+    async def aclose(self) -> None:
+        """Release all pooled connections."""
+        if self._pool is not None:
+            self._pool.disconnect()
+        if self._async_redis is not None:
+            await self._async_redis.connection_pool.disconnect()
+            self._async_redis = None
+
+
 @lru_cache
-def get_queue_manager(settings = Depends(get_settings)) -> QueueManager:
-    return QueueManager(settings)    
+def get_queue_manager() -> QueueManager:
+    return QueueManager(get_settings())
+
 
 def get_queue(queue_manager: Annotated[QueueManager, Depends(get_queue_manager)]) -> Queue:
-    return queue_manager.queue
\ No newline at end of file
+    return queue_manager.queue
@@ -0,0 +1,104 @@
+from functools import lru_cache
+from typing import Callable, Optional
+import os
+from ..core.config import get_settings
+from ..services.cache import PackageCache, ResponseCache
+from ..services.download import DownloadManager
+from ..services.github import AsyncGitHubService
+from ..services.repository import RepositoryService
+from ..services.signing import PRIVATE_KEY_FILE, ReleaseSigner, load_signer
+from ..services.storage import S3StorageService
+
+# Long-lived, per-process service instances. Jobs only carry plain
+# arguments and build what they need from these, so HTTP connection pools
+# are reused across jobs run by the same worker.
+
+
+@lru_cache
+def get_github_service() -> AsyncGitHubService:
+    settings = get_settings()
+    return AsyncGitHubService(
+        settings.github_token,
+        response_cache=ResponseCache(settings.github_cache_path),
+        timeout=(settings.github_connect_timeout, settings.github_read_timeout),
+        retries=settings.github_retries
+    )
+
+
+@lru_cache
+def get_download_manager() -> DownloadManager:
+    settings = get_settings()
+    return DownloadManager(
+        max_workers=settings.download_concurrency,
+        per_host_limit=settings.download_per_host_limit,
+        retries=settings.download_retries,
+        timeout=(settings.download_connect_timeout, settings.download_read_timeout)
+    )
+
+
+@lru_cache
+def get_package_cache() -> PackageCache:
+    return PackageCache(get_settings().package_cache_path)
+
+
+@lru_cache
+def get_storage_service() -> S3StorageService:
+    settings = get_settings()
+    return S3StorageService(
+        access_key_id=settings.aws_access_key_id,
+        secret_access_key=settings.aws_secret_access_key,
+        bucket_name=settings.aws_bucket_name,
+        region=settings.aws_region,
+        max_concurrency=settings.upload_concurrency,
+        multipart_chunksize=settings.multipart_chunksize,
+        stream_buffers=settings.stream_upload_buffers
+    )
+
+
+def get_release_signer() -> Optional[ReleaseSigner]:
+    """Signer for every published repository, or None when signing is not configured."""
+    settings = get_settings()
+    if not settings.gpg_key_email:
+        return None
+    return load_signer(
+        os.path.join(settings.gpg_home, PRIVATE_KEY_FILE),
+        settings.gpg_key_email,
+        settings.gpg_passphrase
+    )
+
+
+def create_repository_service(
+    owner: str,
+    repo: str,
+    progress_callback: Optional[Callable[..., None]] = None
+) -> RepositoryService:
+    """Create the per-build repository service for owner/repo."""
+    settings = get_settings()
+    return RepositoryService(
+        repo_name=f"{owner}/{repo}",
+        base_url=settings.storage_url,
+        package_cache=get_package_cache(),
+        index_path=settings.index_path(owner, repo),
+        compression_formats=settings.compression_formats,
+        compression_levels=settings.compression_levels,
+        architectures=settings.architectures,
+        components=settings.components,
+        download_manager=get_download_manager(),
+        progress_callback=progress_callback,
+        signer=get_release_signer()
+    )
+
+
+def create_aggregate_service(progress_callback: Optional[Callable[..., None]] = None) -> RepositoryService:
+    """Create the repository service that combines a batch of repositories."""
+    settings = get_settings()
+    return RepositoryService(
+        repo_name=settings.combined_repo_name,
+        base_url=settings.storage_url,
+        compression_formats=settings.compression_formats,
+        compression_levels=settings.compression_levels,
+        architectures=settings.architectures,
+        components=settings.components,
+        progress_callback=progress_callback,
+        signer=get_release_signer()
+    )
@@ -0,0 +1,168 @@
+from contextlib import closing
+from dataclasses import dataclass
+from typing import Optional
+import sqlite3
+from loguru import logger
+from ..core.hashing import FileDigest
+from ..core.metrics import CACHE_REQUESTS
+from ..core.models import DebAsset
+
+
+@dataclass(frozen=True)
+class CachedResponse:
+    etag: str
+    body: str
+    next_url: Optional[str]
+
+
+@dataclass(frozen=True)
+class CachedPackage:
+    control: str
+    digest: FileDigest
+
+
+class PackageCache:
+    """
+    Persistent cache of parsed package metadata keyed by GitHub asset identity.
+
+    An asset is identified by its id, updated_at timestamp and size; GitHub
+    changes updated_at whenever an asset is re-uploaded, so a matching key
+    means the package contents are unchanged.
+    """
+
+    def __init__(self, path: str = "package_cache.sqlite"):
+        """
+        Initialize package cache.
+
+        Args:
+            path: Path to the SQLite database file
+        """
+        self.path = path
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS packages (
+                    asset_id INTEGER NOT NULL,
+                    updated_at TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    control TEXT NOT NULL,
+                    md5 TEXT NOT NULL,
+                    sha1 TEXT NOT NULL,
+                    sha256 TEXT NOT NULL,
+                    PRIMARY KEY (asset_id, updated_at, size)
+                )
+                """
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    @staticmethod
+    def _key(asset: DebAsset) -> Optional[tuple]:
+        if asset.id is None or asset.updated_at is None:
+            return None
+        return (asset.id, asset.updated_at.isoformat(), asset.size)
+
+    def get(self, asset: DebAsset) -> Optional[CachedPackage]:
+        """
+        Look up cached metadata for an asset.
+
+        Args:
+            asset: GitHub release asset
+
+        Returns:
+            CachedPackage if the asset is unchanged since it was cached, else None
+        """
+        key = self._key(asset)
+        if key is None:
+            return None
+
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT control, size, md5, sha1, sha256 FROM packages "
+                "WHERE asset_id = ? AND updated_at = ? AND size = ?",
+                key
+            ).fetchone()
+
+        if row is None:
+            CACHE_REQUESTS.inc(cache='package', result='miss')
+            return None
+
+        CACHE_REQUESTS.inc(cache='package', result='hit')
+        control, size, md5, sha1, sha256 = row
+        return CachedPackage(
+            control=control,
+            digest=FileDigest(size=size, md5=md5, sha1=sha1, sha256=sha256)
+        )
+
+    def put(self, asset: DebAsset, control: str, digest: FileDigest) -> None:
+        """
+        Store parsed metadata for an asset.
+
+        Args:
+            asset: GitHub release asset the package was downloaded from
+            control: Control stanza extracted from the package
+            digest: Size and checksums of the package file
+        """
+        key = self._key(asset)
+        if key is None:
+            logger.debug(f"Not caching {asset.name}: asset has no id/updated_at")
+            return
+
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO packages "
+                "(asset_id, updated_at, size, control, md5, sha1, sha256) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (*key, control, digest.md5, digest.sha1, digest.sha256)
+            )
+
+
+class ResponseCache:
+    """
+    Persistent store of API responses and their ETags, keyed by URL.
+
+    Used to make conditional requests: a 304 Not Modified answer is served
+    from the stored body.
+    """
+
+    def __init__(self, path: str = "github_cache.sqlite"):
+        """
+        Initialize response cache.
+
+        Args:
+            path: Path to the SQLite database file
+        """
+        self.path = path
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS responses (
+                    url TEXT PRIMARY KEY,
+                    etag TEXT NOT NULL,
+                    body TEXT NOT NULL,
+                    next_url TEXT
+                )
+                """
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    def get(self, url: str) -> Optional[CachedResponse]:
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT etag, body, next_url FROM responses WHERE url = ?",
+                (url,)
+            ).fetchone()
+
+        if row is None:
+            return None
+        return CachedResponse(*row)
+
+    def put(self, url: str, response: CachedResponse) -> None:
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (url, etag, body, next_url) VALUES (?, ?, ?, ?)",
+                (url, response.etag, response.body, response.next_url)
+            )
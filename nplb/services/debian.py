@@ -1,11 +1,15 @@
-from debian import debfile
+from debian import deb822
+from typing import Optional
+from .download import DownloadManager, download_file
+from ..core.deb import read_control
 from ..core.models import DebInfo
-import requests
 
 class DebianService:
+    def __init__(self, download_manager: Optional[DownloadManager] = None):
+        self.download_manager = download_manager or DownloadManager(max_workers=1, per_host_limit=1)
+
     def extract_deb_info(self, deb_path: str) -> DebInfo:
-        deb = debfile.DebFile(deb_path)
-        control = deb.control.debcontrol()
+        control = deb822.Deb822(read_control(deb_path))
         
         return DebInfo(
             package=control.get('Package', ''),
@@ -15,10 +19,6 @@ class DebianService:
             description=control.get('Description', '')
         )
 
-    def download_file(self, url: str, target_path: str):
-        response = requests.get(url, stream=True)
-        response.raise_for_status()
-        
-        with open(target_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                f.write(chunk) 
\ No newline at end of file
+    def download_file(self, url: str, target_path: str, size: Optional[int] = None):
+        """Download url to target_path, resuming and retrying interrupted transfers."""
+        download_file(url, target_path, size, self.download_manager)
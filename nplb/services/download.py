@@ -0,0 +1,366 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from threading import BoundedSemaphore, Lock
+from typing import Any, Callable, Dict, List, Optional, Protocol, Tuple
+from urllib.parse import urlparse
+import os
+import random
+import time
+from loguru import logger
+import requests
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ChunkedEncodingError
+from ..core.deb import ControlReader
+from ..core.hashing import FileDigest, MultiHasher
+from ..core.metrics import DOWNLOAD_RETRIES, TRANSFER_BYTES
+
+# Statuses worth retrying; anything else in 4xx is a permanent failure
+RETRYABLE_STATUSES = frozenset({408, 429, 500, 502, 503, 504})
+
+
+class DownloadSink(Protocol):
+    """Destination that receives a download as it streams, e.g. an S3 upload"""
+
+    def write(self, chunk: bytes) -> Any: ...
+
+    def reset(self) -> Any:
+        """Discard everything written; the download restarts from the beginning"""
+
+    def close(self) -> Any:
+        """Commit the download once it completed and was verified"""
+
+    def abort(self) -> Any:
+        """Discard everything written; the download failed"""
+
+
+class NullSink:
+    """Sink for an asset whose destination is already current; discards everything"""
+
+    def write(self, chunk: bytes) -> None:
+        pass
+
+    def reset(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+    def abort(self) -> None:
+        pass
+
+
+@dataclass
+class DownloadTask:
+    name: str
+    url: str
+    # None streams the asset without writing it anywhere
+    dest_path: Optional[str]
+    size: Optional[int] = None
+    # Capture the control file of the package as it streams past
+    extract_control: bool = False
+    # Also stream the asset into sink, committed only once it is verified
+    sink: Optional[DownloadSink] = None
+
+
+@dataclass
+class DownloadResult:
+    task: DownloadTask
+    bytes_downloaded: int = 0
+    digest: Optional[FileDigest] = None
+    control: Optional[str] = None
+    error: Optional[Exception] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+@dataclass
+class _Transfer:
+    """State of one download carried across attempts"""
+    task: DownloadTask
+    part_path: Optional[str]
+    hasher: MultiHasher = field(default_factory=MultiHasher)
+    control: Optional[ControlReader] = None
+    # ETag or Last-Modified of the first response; ranges are only honoured while it matches
+    validator: Optional[str] = None
+
+
+class DownloadError(Exception):
+    def __init__(self, failures: List[DownloadResult]):
+        self.failures = failures
+        names = ", ".join(f"{r.task.name} ({r.error})" for r in failures)
+        super().__init__(f"Failed to download {len(failures)} asset(s): {names}")
+
+
+class RetryableDownloadError(Exception):
+    """A failure after which the download may be resumed or retried"""
+
+    def __init__(self, message: str, reason: str, retry_after: Optional[float] = None):
+        self.reason = reason
+        self.retry_after = retry_after
+        super().__init__(message)
+
+
+ProgressCallback = Callable[[DownloadTask, int, Optional[int]], None]
+
+
+class DownloadManager:
+    def __init__(
+        self,
+        max_workers: int = 8,
+        per_host_limit: int = 4,
+        chunk_size: int = 8192,
+        progress_callback: Optional[ProgressCallback] = None,
+        retries: int = 3,
+        backoff: float = 0.5,
+        max_backoff: float = 30.0,
+        timeout: Tuple[float, float] = (10.0, 60.0)
+    ):
+        """
+        Initialize download manager.
+
+        Args:
+            max_workers: Maximum number of concurrent downloads
+            per_host_limit: Maximum number of concurrent connections to a single host
+            chunk_size: Size of chunks read from the response stream
+            progress_callback: Called as (task, bytes_downloaded, total) after every chunk
+            retries: Attempts made after the first one fails; each resumes
+                from the bytes already received
+            backoff: Base delay in seconds of the jittered exponential backoff
+            max_backoff: Upper bound of the delay between attempts
+            timeout: (connect, read) timeouts in seconds of every request
+        """
+        self.max_workers = max(1, max_workers)
+        self.per_host_limit = max(1, per_host_limit)
+        self.chunk_size = chunk_size
+        self.progress_callback = progress_callback
+        self.retries = max(0, retries)
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self._host_limits: Dict[str, BoundedSemaphore] = {}
+        self._host_limits_lock = Lock()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=self.max_workers,
+            pool_maxsize=self.max_workers
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def _host_limit(self, url: str) -> BoundedSemaphore:
+        host = urlparse(url).netloc
+        with self._host_limits_lock:
+            if host not in self._host_limits:
+                self._host_limits[host] = BoundedSemaphore(self.per_host_limit)
+            return self._host_limits[host]
+
+    def download(self, task: DownloadTask, progress_callback: Optional[ProgressCallback] = None) -> DownloadResult:
+        """
+        Download a single asset, capturing any error in the result.
+
+        Dropped connections, timeouts and transient server errors are
+        retried with jittered exponential backoff. Each retry asks for the
+        remaining bytes with a Range request, so an interrupted download
+        resumes instead of starting over. The result is verified against
+        task.size when it is known.
+
+        Tasks without a dest_path are hashed (and, with extract_control,
+        have their control file captured) as they stream, without touching
+        disk. A task's sink receives every byte as well and is closed once
+        the download is verified, or aborted if it fails.
+
+        Args:
+            task: Asset to download
+            progress_callback: Overrides the manager's progress_callback for this download
+
+        Returns:
+            DownloadResult describing the outcome
+        """
+        result = DownloadResult(task=task)
+        transfer = _Transfer(
+            task=task,
+            part_path=self._part_path(task) if task.dest_path else None,
+            control=ControlReader() if task.extract_control else None
+        )
+        try:
+            with self._host_limit(task.url):
+                for attempt in range(self.retries + 1):
+                    try:
+                        self._fetch(transfer, result, progress_callback or self.progress_callback)
+                        break
+                    except (RetryableDownloadError, requests.ConnectionError, requests.Timeout, ChunkedEncodingError) as e:
+                        if attempt == self.retries:
+                            raise
+                        DOWNLOAD_RETRIES.inc(reason=getattr(e, 'reason', 'connection'))
+                        delay = self._backoff_delay(attempt, getattr(e, 'retry_after', None))
+                        logger.warning(
+                            f"Download of {task.name} interrupted at {transfer.hasher.size} bytes ({str(e)}), "
+                            f"retrying in {delay:.1f}s ({attempt + 1}/{self.retries})"
+                        )
+                        time.sleep(delay)
+
+            if transfer.control:
+                result.control = transfer.control.result()
+            if task.sink:
+                task.sink.close()
+            if transfer.part_path:
+                os.replace(transfer.part_path, task.dest_path)
+            result.digest = transfer.hasher.digest()
+            logger.info(f"{'Downloaded' if task.dest_path else 'Streamed'} {task.name} ({result.digest.size} bytes)")
+        except Exception as e:
+            logger.error(f"Failed to download {task.name}: {str(e)}")
+            result.error = e
+            # Never leave a truncated package behind in the pool
+            for path in (transfer.part_path, task.dest_path):
+                if path and os.path.exists(path):
+                    os.remove(path)
+            if task.sink:
+                try:
+                    task.sink.abort()
+                except Exception as abort_error:
+                    logger.warning(f"Failed to discard partial {task.name}: {str(abort_error)}")
+        return result
+
+    @staticmethod
+    def _part_path(task: DownloadTask) -> str:
+        # A dotfile, so it is never indexed or published with the pool
+        directory, name = os.path.split(task.dest_path)
+        return os.path.join(directory, f".{name}.part")
+
+    def _backoff_delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        if retry_after is not None:
+            return min(retry_after, self.max_backoff)
+        # Full jitter keeps concurrent downloads from retrying in lockstep
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def _fetch(self, transfer: _Transfer, result: DownloadResult, progress_callback: Optional[ProgressCallback]) -> None:
+        """Fetch the bytes of a transfer not received yet, appending them to its part file."""
+        task, hasher = transfer.task, transfer.hasher
+        offset = hasher.size
+        headers = {}
+        if offset:
+            headers['Range'] = f"bytes={offset}-"
+            if transfer.validator:
+                headers['If-Range'] = transfer.validator
+
+        with self.session.get(task.url, stream=True, timeout=self.timeout, headers=headers) as response:
+            if response.status_code == 416 and task.size is not None and offset == task.size:
+                # Everything was received before the connection dropped
+                return
+            if response.status_code in RETRYABLE_STATUSES:
+                raise RetryableDownloadError(
+                    f"HTTP {response.status_code}",
+                    'status',
+                    self._retry_after(response.headers.get('Retry-After'))
+                )
+            response.raise_for_status()
+
+            if offset and not self._resumes_at(response, offset):
+                # The server ignored the range or the asset changed: start over
+                logger.info(f"Server cannot resume {task.name}, restarting download")
+                hasher.reset()
+                if transfer.control:
+                    transfer.control.reset()
+                if task.sink:
+                    task.sink.reset()
+                offset = 0
+            if not offset:
+                transfer.validator = response.headers.get('ETag') or response.headers.get('Last-Modified')
+
+            total = task.size or (offset + int(response.headers.get('Content-Length', 0))) or None
+
+            with open(transfer.part_path, 'ab' if offset else 'wb') if transfer.part_path else nullcontext() as f:
+                for chunk in response.iter_content(chunk_size=self.chunk_size):
+                    if f:
+                        f.write(chunk)
+                    if transfer.control:
+                        transfer.control.feed(chunk)
+                    if task.sink:
+                        task.sink.write(chunk)
+                    hasher.update(chunk)
+                    result.bytes_downloaded += len(chunk)
+                    TRANSFER_BYTES.inc(len(chunk), direction='download')
+                    if progress_callback:
+                        progress_callback(task, hasher.size, total)
+
+        if task.size is not None:
+            if hasher.size < task.size:
+                raise RetryableDownloadError(f"Connection closed after {hasher.size} of {task.size} bytes", 'truncated')
+            if hasher.size > task.size:
+                raise ValueError(f"Received {hasher.size} bytes, expected {task.size}")
+
+    @staticmethod
+    def _resumes_at(response: requests.Response, offset: int) -> bool:
+        if response.status_code != 206:
+            return False
+        # Content-Range: bytes <start>-<end>/<size>
+        content_range = response.headers.get('Content-Range', '')
+        try:
+            return int(content_range.split()[1].split('-')[0]) == offset
+        except (IndexError, ValueError):
+            return False
+
+    @staticmethod
+    def _retry_after(value: Optional[str]) -> Optional[float]:
+        try:
+            return max(float(value), 0.0) if value else None
+        except ValueError:
+            return None
+
+    def download_all(
+        self,
+        tasks: List[DownloadTask],
+        progress_callback: Optional[ProgressCallback] = None
+    ) -> List[DownloadResult]:
+        """
+        Download assets concurrently.
+
+        Failures do not cancel the remaining downloads; each result carries
+        its own error so callers can decide how to report them.
+
+        Args:
+            tasks: Assets to download
+            progress_callback: Overrides the manager's progress_callback for
+                these downloads, so a shared manager can report per caller
+
+        Returns:
+            List of DownloadResult in the same order as tasks
+        """
+        if not tasks:
+            return []
+
+        results: Dict[int, DownloadResult] = {}
+        workers = min(self.max_workers, len(tasks))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="download") as executor:
+            futures = {executor.submit(self.download, task, progress_callback): i for i, task in enumerate(tasks)}
+            for future in as_completed(futures):
+                results[futures[future]] = future.result()
+
+        return [results[i] for i in range(len(tasks))]
+
+
+def download_file(url: str, target_path: str, size: Optional[int] = None, manager: Optional[DownloadManager] = None) -> FileDigest:
+    """
+    Download a single file with the retries and resumption of DownloadManager.
+
+    Args:
+        url: URL to download
+        target_path: Where to write the file
+        size: Expected size in bytes, verified when given
+        manager: Download manager to use; a single-connection one is created if omitted
+
+    Returns:
+        Size and checksums of the downloaded file
+
+    Raises:
+        DownloadError: If the download failed
+    """
+    manager = manager or DownloadManager(max_workers=1, per_host_limit=1)
+    result = manager.download(DownloadTask(name=os.path.basename(target_path), url=url, dest_path=target_path, size=size))
+    if not result.ok:
+        raise DownloadError([result])
+    return result.digest
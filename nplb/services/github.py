@@ -1,31 +1,197 @@
-from typing import List
-from github import Github
+from typing import AsyncIterator, List, Optional, Tuple
+import asyncio
+import hashlib
+import json
+from loguru import logger
+import urllib3
+from ..core.metrics import CACHE_REQUESTS
 from ..core.models import Release, DebAsset
+from .cache import CachedResponse, ResponseCache
 
-class GitHubService:
-    def __init__(self, github_token: str):
-        self.client = Github(github_token)
-    
-    def get_releases(self, owner: str, repo: str, limit: int = 1) -> List[Release]:
-        repo = self.client.get_repo(f"{owner}/{repo}")
-        releases = []
-        
-        for release in repo.get_releases()[:limit]:
-            assets = []
-            for asset in release.get_assets():
-                if asset.name.endswith('.deb'):
-                    assets.append(DebAsset(
-                        name=asset.name,
-                        download_url=asset.browser_download_url,
-                        size=asset.size
-                    ))
-            
-            if assets:
-                releases.append(Release(
-                    tag_name=release.tag_name,
-                    name=release.title or release.tag_name,
-                    published_at=release.published_at,
-                    assets=assets
-                ))
-        
-        return releases
\ No newline at end of file
+
+class GitHubError(Exception):
+    """GitHub could not be reached or answered with an error"""
+
+
+class GitHubTimeoutError(GitHubError):
+    """GitHub did not answer in time, even after retrying"""
+
+
+class AsyncGitHubService:
+    """
+    Asynchronous GitHub release discovery using the REST releases endpoint.
+
+    Release lists embed their assets, so one request covers a page of up to
+    per_page releases. Every page is fetched conditionally with its stored
+    ETag; GitHub answers unchanged pages with 304 Not Modified, which does
+    not count against the rate limit.
+
+    Requests go through a pooled urllib3 client run in worker threads, as
+    no asyncio HTTP client is among our dependencies; the coroutines do not
+    block the event loop, but each in-flight page holds a thread.
+    """
+
+    def __init__(
+        self,
+        github_token: str,
+        response_cache: ResponseCache = None,
+        api_url: str = "https://api.github.com",
+        per_page: int = 100,
+        max_connections: int = 10,
+        timeout: Tuple[float, float] = (5.0, 15.0),
+        retries: int = 2
+    ):
+        """
+        Initialize async GitHub service.
+
+        Args:
+            github_token: Token used to authenticate API requests
+            response_cache: Store of ETags and bodies for conditional requests
+            api_url: Base URL of the GitHub REST API
+            per_page: Releases requested per page (GitHub allows at most 100)
+            max_connections: Maximum concurrent API requests
+            timeout: (connect, read) timeout in seconds of each request
+            retries: Retries of a request that failed to connect, timed out or got a 5xx answer
+        """
+        self.github_token = github_token
+        self.response_cache = response_cache
+        self.api_url = api_url.rstrip('/')
+        self.per_page = max(1, min(per_page, 100))
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.retries = retries
+        self._http = None
+
+    def __getstate__(self):
+        # Connection pools hold locks and sockets; rebuild them after unpickling
+        state = self.__dict__.copy()
+        state['_http'] = None
+        return state
+
+    @property
+    def http(self) -> urllib3.PoolManager:
+        if self._http is None:
+            connect, read = self.timeout
+            self._http = urllib3.PoolManager(
+                maxsize=self.max_connections,
+                timeout=urllib3.Timeout(connect=connect, read=read),
+                retries=urllib3.Retry(
+                    total=self.retries,
+                    backoff_factor=0.5,
+                    status_forcelist=(500, 502, 503, 504),
+                    allowed_methods=('GET',),
+                    raise_on_status=False
+                )
+            )
+        return self._http
+
+    def _fetch_page(self, url: str) -> Tuple[list, Optional[str]]:
+        """Fetch one page of results, revalidating a stored copy if there is one."""
+        headers = {
+            'Accept': 'application/vnd.github+json',
+            'X-GitHub-Api-Version': '2022-11-28',
+        }
+        if self.github_token:
+            headers['Authorization'] = f"Bearer {self.github_token}"
+
+        cached = self.response_cache.get(url) if self.response_cache else None
+        if cached:
+            headers['If-None-Match'] = cached.etag
+
+        try:
+            response = self.http.request('GET', url, headers=headers)
+        except urllib3.exceptions.MaxRetryError as e:
+            # A refused connection is a NewConnectionError, which urllib3 derives from its timeouts
+            timed_out = isinstance(e.reason, urllib3.exceptions.TimeoutError)
+            if timed_out and not isinstance(e.reason, urllib3.exceptions.NewConnectionError):
+                raise GitHubTimeoutError(f"GitHub API request to {url} timed out") from e
+            raise GitHubError(f"GitHub API request to {url} failed: {e.reason}") from e
+        except urllib3.exceptions.TimeoutError as e:
+            raise GitHubTimeoutError(f"GitHub API request to {url} timed out") from e
+        except urllib3.exceptions.HTTPError as e:
+            raise GitHubError(f"GitHub API request to {url} failed: {str(e)}") from e
+
+        if response.status == 304 and cached:
+            logger.debug(f"Not modified: {url}")
+            CACHE_REQUESTS.inc(cache='github', result='hit')
+            return json.loads(cached.body), cached.next_url
+
+        if self.response_cache:
+            CACHE_REQUESTS.inc(cache='github', result='miss')
+
+        if response.status != 200:
+            raise GitHubError(f"GitHub API request to {url} failed with status {response.status}")
+
+        body = response.data.decode('utf-8')
+        next_url = self._next_url(response.headers.get('Link', ''))
+        etag = response.headers.get('ETag')
+        if self.response_cache and etag:
+            self.response_cache.put(url, CachedResponse(etag=etag, body=body, next_url=next_url))
+
+        return json.loads(body), next_url
+
+    @staticmethod
+    def _next_url(link_header: str) -> Optional[str]:
+        for link in link_header.split(','):
+            url, _, params = link.partition(';')
+            if 'rel="next"' in params:
+                return url.strip().strip('<>')
+        return None
+
+    @staticmethod
+    def _to_release(data: dict) -> Optional[Release]:
+        assets = [
+            DebAsset(
+                name=asset['name'],
+                download_url=asset['browser_download_url'],
+                size=asset['size'],
+                id=asset['id'],
+                updated_at=asset['updated_at']
+            )
+            for asset in data.get('assets', [])
+            if asset['name'].endswith('.deb')
+        ]
+        if not assets:
+            return None
+
+        return Release(
+            tag_name=data['tag_name'],
+            name=data.get('name') or data['tag_name'],
+            published_at=data.get('published_at'),
+            assets=assets
+        )
+
+    async def iter_releases(self, owner: str, repo: str, limit: Optional[int] = None) -> AsyncIterator[Release]:
+        """
+        Yield releases with .deb assets page by page as they are fetched.
+
+        Args:
+            owner: Repository owner
+            repo: Repository name
+            limit: Number of most recent releases to consider (all if None)
+        """
+        per_page = min(self.per_page, limit) if limit else self.per_page
+        url = f"{self.api_url}/repos/{owner}/{repo}/releases?per_page={per_page}"
+        seen = 0
+
+        while url:
+            page, url = await asyncio.to_thread(self._fetch_page, url)
+            for data in page:
+                seen += 1
+                release = self._to_release(data)
+                if release:
+                    yield release
+                if limit and seen >= limit:
+                    return
+
+    async def get_releases(self, owner: str, repo: str, limit: int = 1) -> List[Release]:
+        return [release async for release in self.iter_releases(owner, repo, limit)]
+
+
+def release_fingerprint(releases: List[Release]) -> str:
+    """Short digest identifying the .deb assets of releases"""
+    digest = hashlib.sha256()
+    for release in releases:
+        for asset in release.assets:
+            digest.update(f"{asset.id}:{asset.updated_at}:{asset.size}\n".encode())
+    return digest.hexdigest()[:16]
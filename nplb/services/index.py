@@ -0,0 +1,503 @@
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import hashlib
+import json
+import os
+import shutil
+import sys
+from loguru import logger
+from debian import deb822
+from ..core.hashing import hash_file
+from ..core.metrics import CACHE_REQUESTS
+
+
+class PublishedIndexError(Exception):
+    pass
+
+
+def file_fingerprint(path: str | Path) -> str:
+    """Cheap identity for a pool file whose checksum is not known yet."""
+    stat = os.stat(path)
+    return f"{stat.st_size}-{stat.st_mtime_ns}"
+
+
+def write_stanzas(packages_path: str | Path, stanzas: List[str]) -> int:
+    """
+    Write stanzas as a Packages file.
+
+    Returns:
+        Number of stanzas written
+    """
+    with open(packages_path, 'w', encoding='utf-8') as f:
+        for stanza in stanzas:
+            f.write(stanza)
+            f.write('\n\n')
+    return len(stanzas)
+
+
+def write_by_hash(files: List[Path], retention: int = 3) -> List[Path]:
+    """
+    Copy index files into the by-hash/SHA256 directory next to them.
+
+    Copies that already exist are touched so they count as the newest
+    generation. Only the newest retention generations (retention times the
+    number of files) are kept; older copies are removed.
+
+    Args:
+        files: Index files from one directory (e.g. Packages and its compressed variants)
+        retention: Number of index generations to keep available
+
+    Returns:
+        Paths of the by-hash copies of files
+    """
+    files = [Path(path) for path in files]
+    if not files:
+        return []
+
+    by_hash_dir = files[0].parent / 'by-hash' / 'SHA256'
+    by_hash_dir.mkdir(parents=True, exist_ok=True)
+
+    written = []
+    for path in files:
+        target = by_hash_dir / hash_file(path).sha256
+        if target.exists():
+            os.utime(target)
+        else:
+            tmp_path = target.with_name(target.name + '.tmp')
+            shutil.copyfile(path, tmp_path)
+            os.replace(tmp_path, target)
+        written.append(target)
+
+    generations = sorted(by_hash_dir.iterdir(), key=lambda p: p.stat().st_mtime_ns, reverse=True)
+    for stale in generations[max(retention, 1) * len(files):]:
+        if stale not in written:
+            stale.unlink()
+            logger.debug(f"Pruned {stale}")
+
+    return written
+
+
+def _order(char: str) -> int:
+    # dpkg's character weights: ~ before the end of a part, letters before other symbols
+    if char == '~':
+        return -1
+    if char.isalpha():
+        return ord(char)
+    return ord(char) + 256
+
+
+def _part_key(part: str) -> Tuple:
+    """Key of an upstream version or revision, compared as dpkg compares them"""
+    pairs = []
+    i = 0
+    while i < len(part):
+        start = i
+        while i < len(part) and not part[i].isdigit():
+            i += 1
+        # Non-digit runs end with 0, which sorts after ~ and before any character
+        letters = tuple(_order(char) for char in part[start:i]) + (0,)
+        start = i
+        while i < len(part) and part[i].isdigit():
+            i += 1
+        pairs.append((letters, int(part[start:i] or 0)))
+    # Trailing empty or zero parts compare equal to nothing at all. The first
+    # pair stays, so the end marker is never compared against a leading zero
+    while len(pairs) > 1 and pairs[-1] == ((0,), 0):
+        pairs.pop()
+    return tuple(pairs or [((0,), 0)]) + (((0,), 0),)
+
+
+@lru_cache(maxsize=8192)
+def version_key(version: str) -> Tuple:
+    """
+    Sort key ordering version strings as Debian does.
+
+    Epoch, upstream version and revision are compared in turn, digits
+    numerically and everything else by dpkg's character order (so 1.0~rc1
+    sorts before 1.0). Unparseable epochs count as 0.
+    """
+    # The epoch ends at the first colon; later colons belong to the upstream version
+    epoch, _, rest = version.partition(':') if ':' in version else ('0', '', version)
+    upstream, _, revision = rest.rpartition('-') if '-' in rest else (rest, '', '')
+    return (int(epoch) if epoch.isdigit() else 0, _part_key(upstream), _part_key(revision))
+
+
+@lru_cache(maxsize=256)
+def _insertions(layout: str) -> Tuple[Tuple[int, str, str], ...]:
+    """Decode a record layout into line insertions, later fields first so positions stay valid."""
+    pairs = [(ord(layout[i + 1]), *PackageRecord.FIELDS[ord(layout[i])]) for i in range(0, len(layout), 2)]
+    return tuple(reversed(pairs))
+
+
+class PackageRecord:
+    """
+    One indexed package: the fields the index sorts and filters by, and the rest of its stanza.
+
+    Package, Version, Architecture, Section and Maintainer are stored once,
+    interned, and cut out of the stanza text; layout records where their
+    lines go, so stanza rebuilds the original text exactly. No field is
+    held twice, and records are slotted rather than dicts.
+    """
+
+    __slots__ = (
+        'filename', 'fingerprint', 'rest', 'layout',
+        'package', 'version', 'architecture', 'section', 'maintainer'
+    )
+
+    # Control fields kept on the record and the attributes holding them
+    FIELDS = (
+        ('Package', 'package'),
+        ('Version', 'version'),
+        ('Architecture', 'architecture'),
+        ('Section', 'section'),
+        ('Maintainer', 'maintainer'),
+    )
+    _BY_NAME = {name.lower(): (number, name, attribute) for number, (name, attribute) in enumerate(FIELDS)}
+
+    def __init__(
+        self,
+        filename: str,
+        fingerprint: str,
+        rest: str,
+        layout: str = '',
+        package: str = '',
+        version: str = '',
+        architecture: str = '',
+        section: str = '',
+        maintainer: str = ''
+    ):
+        self.filename = filename
+        self.fingerprint = fingerprint
+        self.rest = rest
+        # Pairs of (field number, lines of rest before it), one character each
+        self.layout = sys.intern(layout)
+        self.package = sys.intern(package)
+        self.version = sys.intern(version)
+        self.architecture = sys.intern(architecture)
+        self.section = sys.intern(section)
+        self.maintainer = sys.intern(maintainer)
+
+    @classmethod
+    def from_stanza(cls, filename: str, fingerprint: str, stanza: str) -> 'PackageRecord':
+        """Build a record, reading its fields in one pass over the stanza."""
+        fields = {}
+        layout = []
+        rest = []
+        for line in stanza.split('\n'):
+            if line[:1] not in (' ', '\t'):
+                name, _, value = line.partition(':')
+                known = cls._BY_NAME.get(name.lower())
+                if known and known[2] not in fields:
+                    number, name, attribute = known
+                    fields[attribute] = value = value.strip()
+                    # Only lines that rebuild exactly are cut out of the text
+                    if line == f"{name}: {value}":
+                        layout.append(chr(number) + chr(len(rest)))
+                        continue
+            rest.append(line)
+        return cls(filename, fingerprint, '\n'.join(rest), ''.join(layout), **fields)
+
+    @property
+    def stanza(self) -> str:
+        """The package's Packages stanza"""
+        lines = self.rest.split('\n')
+        for position, name, attribute in _insertions(self.layout):
+            lines.insert(position, f"{name}: {getattr(self, attribute)}")
+        return '\n'.join(lines)
+
+    def sort_key(self) -> Tuple:
+        """Package name, then Debian version order, then architecture"""
+        return (self.package, version_key(self.version), self.architecture, self.filename)
+
+    def __repr__(self) -> str:
+        return f"PackageRecord({self.package} {self.version} {self.architecture}, {self.filename})"
+
+
+class PackageIndex:
+    """
+    Persisted set of Packages stanzas keyed by pool filename.
+
+    Each record keeps a fingerprint of the package it was built from (its
+    SHA256 when known, otherwise its size and mtime). Stanzas are only
+    rebuilt for packages whose fingerprint changed, so regenerating
+    Packages costs one parse per added or replaced package rather than one
+    per package in the pool.
+
+    Stanzas are served ordered by package name and Debian version, which
+    keeps Packages files deterministic and makes "latest versions" queries
+    a single pass.
+    """
+
+    VERSION = 2
+
+    def __init__(self, path: str | Path = None):
+        """
+        Initialize package index.
+
+        Args:
+            path: JSON file the index is persisted to. When omitted the index
+                only lives in memory.
+        """
+        self.path = Path(path) if path else None
+        self.records: Dict[str, PackageRecord] = {}
+        self.changed = False
+        self._sorted: Optional[List[PackageRecord]] = None
+
+        if self.path and self.path.exists():
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                self._load(data)
+            except (OSError, ValueError, TypeError) as e:
+                logger.warning(f"Ignoring unreadable package index {self.path}: {str(e)}")
+
+    def _load(self, data: dict) -> None:
+        if data.get('version') == self.VERSION:
+            rows = data.get('packages', [])
+        elif data.get('version') == 1:
+            # Version 1 kept a dict of fields per filename
+            rows = [(filename, entry['fingerprint'], entry['stanza']) for filename, entry in data.get('entries', {}).items()]
+        else:
+            return
+        for filename, fingerprint, stanza in rows:
+            self.records[filename] = PackageRecord.from_stanza(filename, fingerprint, stanza)
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def __contains__(self, filename: str) -> bool:
+        return filename in self.records
+
+    def _modified(self) -> None:
+        self.changed = True
+        self._sorted = None
+
+    def update(self, filename: str, fingerprint: str, build_stanza: Callable[[], str]) -> bool:
+        """
+        Ensure filename has an up to date stanza.
+
+        Args:
+            filename: Pool filename of the package
+            fingerprint: Identity of the package contents
+            build_stanza: Called to produce the stanza when it is missing or stale
+
+        Returns:
+            True if the stanza was (re)built
+        """
+        record = self.records.get(filename)
+        if record and record.fingerprint == fingerprint:
+            CACHE_REQUESTS.inc(cache='index', result='hit')
+            return False
+
+        CACHE_REQUESTS.inc(cache='index', result='miss')
+
+        self.records[filename] = PackageRecord.from_stanza(filename, fingerprint, build_stanza().strip('\n'))
+        self._modified()
+        logger.debug(f"Indexed {filename}")
+        return True
+
+    def retain(self, filenames: Iterable[str]) -> List[str]:
+        """
+        Drop every record not in filenames.
+
+        Returns:
+            Filenames that were removed
+        """
+        keep = set(filenames)
+        removed = [filename for filename in self.records if filename not in keep]
+        for filename in removed:
+            del self.records[filename]
+            logger.debug(f"Removed {filename} from index")
+        if removed:
+            self._modified()
+        return removed
+
+    def merge(self, other: 'PackageIndex', prefix: str) -> None:
+        """
+        Add every record of other under prefix.
+
+        Filename fields are rewritten to prefix/<Filename> so they stay
+        valid relative to the repository holding the merged index.
+
+        Args:
+            other: Index to merge in
+            prefix: Path of other's repository relative to this one
+        """
+        for filename, record in other.records.items():
+            stanza = '\n'.join(
+                f"Filename: {prefix}/{line[len('Filename:'):].strip()}"
+                if line.startswith('Filename:') else line
+                for line in record.stanza.splitlines()
+            )
+            self.records[f"{prefix}/{filename}"] = PackageRecord.from_stanza(f"{prefix}/{filename}", record.fingerprint, stanza)
+        self._modified()
+
+    def sorted_records(self) -> List[PackageRecord]:
+        """Records ordered by package name, Debian version and architecture"""
+        if self._sorted is None:
+            self._sorted = sorted(self.records.values(), key=PackageRecord.sort_key)
+        return self._sorted
+
+    def latest(self, count: int = 1, architecture: Optional[str] = None) -> List[PackageRecord]:
+        """
+        The count newest versions of every package.
+
+        Versions are compared in Debian order and counted separately for
+        each architecture a package is built for.
+
+        Args:
+            count: Versions to keep per package and architecture
+            architecture: Only include packages for this architecture or 'all'
+
+        Returns:
+            Matching records in index order
+        """
+        records = [
+            record for record in self.sorted_records()
+            if architecture is None or record.architecture in (architecture, 'all')
+        ]
+        kept = []
+        seen: Dict[Tuple[str, str], int] = {}
+        # Newest first, so the first count records of a group are the ones kept
+        for record in reversed(records):
+            group = (record.package, record.architecture)
+            if seen.get(group, 0) < count:
+                seen[group] = seen.get(group, 0) + 1
+                kept.append(record)
+        kept.reverse()
+        return kept
+
+    def architectures(self) -> List[str]:
+        """Architectures of the indexed packages, excluding 'all'"""
+        return sorted({record.architecture for record in self.records.values()} - {'all', ''})
+
+    def stanzas(self, architecture: Optional[str] = None, latest: Optional[int] = None) -> List[str]:
+        """
+        Return stanzas in deterministic (package, version) order.
+
+        Args:
+            architecture: Only include packages for this architecture or 'all'
+            latest: Only include this many newest versions of each package
+        """
+        if latest is not None:
+            return [record.stanza for record in self.latest(latest, architecture)]
+        return [
+            record.stanza
+            for record in self.sorted_records()
+            if architecture is None or record.architecture in (architecture, 'all')
+        ]
+
+    def by_architecture(self, architectures: Iterable[str]) -> Dict[str, List[str]]:
+        """
+        Bucket stanzas by architecture in a single pass over the index.
+
+        Packages for 'all' go to every bucket; packages for architectures
+        not in architectures are left out.
+
+        Args:
+            architectures: Architectures to build buckets for
+
+        Returns:
+            Mapping of architecture to stanzas in deterministic (package, version) order
+        """
+        return self.by_component(['main'], architectures)['main']
+
+    def by_component(self, components: List[str], architectures: Iterable[str]) -> Dict[str, Dict[str, List[str]]]:
+        """
+        Bucket stanzas by component and architecture in a single pass over the index.
+
+        A package belongs to the component named by the area of its Section
+        ('contrib/net' is in contrib). Packages without an area, or whose
+        area is not served, belong to the first component. Within a
+        component, packages are bucketed as by by_architecture.
+
+        Args:
+            components: Components to build buckets for; the first is the default
+            architectures: Architectures to build buckets for
+
+        Returns:
+            Mapping of component to architecture to stanzas in deterministic (package, version) order
+        """
+        architectures = list(architectures)
+        buckets = {component: {arch: [] for arch in architectures} for component in components}
+        for record in self.sorted_records():
+            area = record.section.split('/', 1)[0] if '/' in record.section else None
+            component = buckets.get(area) or buckets[components[0]]
+
+            if record.architecture == 'all':
+                for stanzas in component.values():
+                    stanzas.append(record.stanza)
+            elif record.architecture in component:
+                component[record.architecture].append(record.stanza)
+            else:
+                logger.debug(f"Skipping {record.filename}: architecture {record.architecture} is not served")
+        return buckets
+
+    def write_packages(self, packages_path: str | Path, architecture: Optional[str] = None) -> int:
+        """
+        Serialize the index as a Packages file.
+
+        Returns:
+            Number of stanzas written
+        """
+        return write_stanzas(packages_path, self.stanzas(architecture))
+
+    def save(self) -> None:
+        """Persist the index atomically if it has a path."""
+        if not self.path:
+            return
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + '.tmp')
+        # Rows sorted by filename, so identical indices serialize identically
+        rows = [
+            [filename, record.fingerprint, record.stanza]
+            for filename, record in sorted(self.records.items())
+        ]
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': self.VERSION, 'packages': rows}, f, separators=(',', ':'))
+        os.replace(tmp_path, self.path)
+        self.changed = False
+
+
+def read_published_index(read: Callable[[str], Optional[bytes]], suite_path: str) -> PackageIndex:
+    """
+    Load the package index of a published repository from its Release and Packages files.
+
+    Every uncompressed Packages file listed in Release is read and checked
+    against its SHA256 there, so a repository caught mid-publish is
+    reported rather than read inconsistently. Stanzas keep their Filename,
+    relative to the repository root.
+
+    Args:
+        read: Returns the contents of a file by path, or None if it does not exist
+        suite_path: Path of the suite, e.g. owner/repo/dists/stable
+
+    Raises:
+        PublishedIndexError: If Release or a Packages file it lists is missing or does not match
+    """
+    release_path = f"{suite_path}/Release"
+    release_data = read(release_path)
+    if release_data is None:
+        raise PublishedIndexError(f"{release_path} does not exist")
+
+    index = PackageIndex()
+    for entry in deb822.Release(release_data.decode('utf-8')).get('SHA256', []):
+        if os.path.basename(entry['name']) != 'Packages':
+            continue
+        packages_path = f"{suite_path}/{entry['name']}"
+        data = read(packages_path)
+        if data is None:
+            raise PublishedIndexError(f"{packages_path} listed in {release_path} does not exist")
+        if len(data) != int(entry['size']) or hashlib.sha256(data).hexdigest() != entry['sha256']:
+            raise PublishedIndexError(f"{packages_path} does not match {release_path}")
+
+        # Packages for 'all' are listed under every architecture; the pool filename dedupes them
+        for paragraph in deb822.Packages.iter_paragraphs(data.decode('utf-8').splitlines(), use_apt_pkg=False):
+            filename = os.path.basename(paragraph['Filename'])
+            index.records[filename] = PackageRecord.from_stanza(
+                filename, paragraph.get('SHA256', ''), paragraph.dump().strip('\n')
+            )
+
+    return index
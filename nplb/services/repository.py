@@ -1,12 +1,23 @@
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Dict
+from typing import Callable, List, Dict, Optional
 import os
 import tempfile
 from loguru import logger
 import requests
-import hashlib
-import gnupg
-from debian import debfile  # For parsing .deb files
+from debian import deb822
+from .cache import CachedPackage, PackageCache
+from .download import DownloadError, DownloadManager, DownloadResult, DownloadSink, DownloadTask
+from .index import PackageIndex, write_by_hash, write_stanzas
+from .signing import PRIVATE_KEY_FILE, ReleaseSigner, load_signer
+from ..core.compression import compress_file
+from ..core.deb import read_control
+from ..core.hashing import FileDigest, format_release_checksums, hash_file, hash_files
+from ..core.metrics import STAGE_SECONDS
+from ..core.models import DebAsset
+
+# Fields _add_index_fields adds to a package's control fields
+INDEX_FIELDS = ('Filename', 'Size', 'MD5sum', 'SHA1', 'SHA256')
 
 class RepositoryService:
     def __init__(
@@ -14,7 +25,18 @@ class RepositoryService:
         repo_name: str,
         base_url: str,
         gpg_home: str = None,
-        gpg_key_email: str = None
+        gpg_key_email: str = None,
+        download_concurrency: int = 8,
+        download_per_host_limit: int = 4,
+        package_cache: PackageCache = None,
+        index_path: str = None,
+        compression_formats: List[str] = None,
+        compression_levels: Dict[str, int] = None,
+        architectures: List[str] = None,
+        components: List[str] = None,
+        download_manager: DownloadManager = None,
+        progress_callback: Optional[Callable[..., None]] = None,
+        signer: ReleaseSigner = None
     ):
         """
         Initialize repository service.
@@ -22,8 +44,28 @@ class RepositoryService:
         Args:
             repo_name: Name of repository (e.g. 'owner/repo')
             base_url: Base URL for the repository
-            gpg_home: Path to GPG home directory
+            gpg_home: Directory holding the exported signing key (private-key.gpg)
             gpg_key_email: Email of GPG key to use for signing
+            download_concurrency: Maximum number of assets downloaded at once
+            download_per_host_limit: Maximum concurrent connections per host
+            package_cache: Cache of parsed package metadata; unchanged assets
+                found in it are neither downloaded nor parsed again
+            index_path: Path of the persisted package index. Stanzas of
+                packages already in it are reused instead of regenerated.
+            compression_formats: Compressed variants of Packages to generate
+                (defaults to gz and xz)
+            compression_levels: Compression level per format
+            architectures: Architectures to index. When omitted every
+                architecture found among the packages is served.
+            components: Components to index (defaults to main). Packages go
+                to the component named by the area of their Section, or the
+                first component.
+            download_manager: Shared download manager whose connection pool
+                outlives this service. When omitted one is created per
+                download_artifacts call from the concurrency limits above.
+            progress_callback: Called as (stage, **details) as the build
+                progresses through downloading, indexing, compressing and signing
+            signer: Release signer to use instead of loading the key from gpg_home
         """
         self.repo_name = repo_name
         self.base_url = base_url
@@ -32,6 +74,25 @@ class RepositoryService:
         self.dists_dir = None
         self.gpg_home = gpg_home
         self.gpg_key_email = gpg_key_email
+        self.download_concurrency = download_concurrency
+        self.download_per_host_limit = download_per_host_limit
+        self.package_cache = package_cache
+        self.index_path = index_path
+        self.compression_formats = compression_formats or ['gz', 'xz']
+        self.compression_levels = compression_levels or {}
+        self.architectures = architectures or []
+        self.components = components or ['main']
+        self.download_manager = download_manager
+        self.progress_callback = progress_callback
+        self.signer = signer
+        # Size and checksums recorded while downloading, keyed by pool filename
+        self.digests: Dict[str, FileDigest] = {}
+        # Source assets of downloaded packages, keyed by pool filename
+        self.assets: Dict[str, DebAsset] = {}
+        # Packages whose metadata was served from the cache, keyed by pool filename
+        self.cached_packages: Dict[str, CachedPackage] = {}
+        # Parsed packages not cached until their pool objects are published, keyed by pool filename
+        self.unpublished_packages: Dict[str, CachedPackage] = {}
         
     def create_repository(self) -> str:
         """
@@ -54,41 +115,108 @@ class RepositoryService:
         logger.info("Repository structure created")
         return self.temp_dir
         
-    def download_artifacts(self, releases: List[dict]) -> None:
+    @STAGE_SECONDS.time(stage='download')
+    def download_artifacts(
+        self,
+        releases: List[dict],
+        index_only: bool = False,
+        pool_sink: Optional[Callable[[DebAsset], DownloadSink]] = None
+    ) -> None:
         """
         Download release artifacts into pool directory.
         
+        Assets are fetched concurrently, bounded by download_concurrency and
+        download_per_host_limit. All downloads are attempted before any
+        failure is reported. Assets already present in the package cache are
+        skipped; their pool files are expected to be published already, as
+        packages are only cached by commit_package_cache once they are.
+        
         Args:
             releases: List of GitHub release objects containing assets
+            index_only: The pool is already published, so assets are only
+                streamed: each is hashed and its control file read on the
+                fly, and nothing is written to the pool
+            pool_sink: Called with each asset to get where its pool object
+                is streamed to (e.g. an S3 upload). Assets are then indexed
+                as with index_only and never written to local disk.
+            
+        Raises:
+            DownloadError: If one or more assets failed to download
         """
         if not self.pool_dir:
             raise ValueError("Repository not initialized. Call create_repository() first.")
             
+        tasks = []
         for release in releases:
             for asset in release.assets:
                 if not asset.name.endswith('.deb'):
                     logger.debug(f"Skipping non-deb asset: {asset.name}")
                     continue
                     
-                dest_path = os.path.join(self.pool_dir, asset.name)
-                logger.info(f"Downloading {asset.name} to {dest_path}")
+                if self.package_cache:
+                    cached = self.package_cache.get(asset)
+                    if cached:
+                        logger.info(f"Using cached metadata for unchanged asset {asset.name}")
+                        self.cached_packages[asset.name] = cached
+                        continue
+                    
+                self.assets[asset.name] = asset
+                streamed = index_only or pool_sink is not None
+                dest_path = None if streamed else os.path.join(self.pool_dir, asset.name)
+                logger.info(f"Queueing {asset.name} for {'streaming' if streamed else f'download to {dest_path}'}")
+                tasks.append(DownloadTask(
+                    name=asset.name,
+                    url=asset.download_url,
+                    dest_path=dest_path,
+                    size=asset.size,
+                    extract_control=streamed,
+                    sink=pool_sink(asset) if pool_sink and not index_only else None
+                ))
                 
-                self._download_file(asset.download_url, dest_path)
+        manager = self.download_manager or DownloadManager(
+            max_workers=self.download_concurrency,
+            per_host_limit=self.download_per_host_limit
+        )
+        results = manager.download_all(tasks, self._report_download if self.progress_callback else None)
+        
+        for result in results:
+            if not result.ok:
+                continue
+            if result.control is not None:
+                # Indexed like a cached package: from its control file and digest alone
+                self.cached_packages[result.task.name] = self._stream_package(result)
+            else:
+                self.digests[os.path.basename(result.task.dest_path)] = result.digest
                 
-    def _download_file(self, url: str, dest_path: str) -> None:
-        """
-        Download a file from a URL to a destination path.
+        failures = [result for result in results if not result.ok]
+        if failures:
+            raise DownloadError(failures)
+            
+        logger.info(f"Downloaded {len(results)} assets")
+                
+    def _stream_package(self, result: DownloadResult) -> CachedPackage:
+        package = CachedPackage(control=result.control, digest=result.digest)
+        if result.task.sink is not None and self.package_cache:
+            # The sink only completes the pool object once the download is verified
+            self.package_cache.put(self.assets[result.task.name], package.control, package.digest)
+        else:
+            self.unpublished_packages[result.task.name] = package
+        return package
         
-        Args:
-            url: URL to download from
-            dest_path: Path to save the file to
+    def commit_package_cache(self) -> None:
         """
-        response = requests.get(url, stream=True)
-        response.raise_for_status()
+        Cache the metadata of packages whose pool objects are now published.
         
-        with open(dest_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                f.write(chunk)
+        Call after publishing the pool. Cached assets are neither downloaded
+        nor uploaded again, so caching a package whose pool object was never
+        published would leave Packages pointing at a missing file.
+        """
+        if self.package_cache:
+            for filename, package in self.unpublished_packages.items():
+                asset = self.assets.get(filename)
+                if asset:
+                    self.package_cache.put(asset, package.control, package.digest)
+        self.unpublished_packages = {}
                 
     def cleanup(self) -> None:
         """Remove temporary directory and all contents."""
@@ -98,82 +226,149 @@ class RepositoryService:
             logger.info(f"Cleaned up temporary directory {self.temp_dir}")
             self.temp_dir = None
             self.pool_dir = None
-            self.dists_dir = None 
+            self.dists_dir = None
+            self.digests = {}
+            self.assets = {}
+            self.cached_packages = {}
+            self.unpublished_packages = {}
 
-    def generate_metadata(self) -> None:
-        """Generate repository metadata files."""
+    def generate_metadata(self, index: PackageIndex = None) -> None:
+        """
+        Generate repository metadata files.
+        
+        Args:
+            index: Prebuilt package index to publish instead of indexing the pool
+        """
         if not self.pool_dir or not self.dists_dir:
             raise ValueError("Repository not initialized. Call create_repository() first.")
             
-        # Create binary package directories
-        binary_dir = os.path.join(self.dists_dir, "main", "binary-amd64")
-        os.makedirs(binary_dir, exist_ok=True)
+        index = self._update_index(index)
         
-        # Generate Packages file
-        packages_path = os.path.join(binary_dir, "Packages")
-        self._generate_packages_file(packages_path)
+        # Classify every package once, then build all indices from the shared stanzas
+        architectures = self.architectures or index.architectures() or ['amd64']
+        buckets = index.by_component(self.components, architectures)
+        jobs = [
+            (component, arch, stanzas)
+            for component, by_arch in buckets.items()
+            for arch, stanzas in by_arch.items()
+        ]
         
-        # Generate compressed versions
-        self._compress_file(packages_path)
+        # Compression runs outside the GIL, so indices are built concurrently
+        with ThreadPoolExecutor(max_workers=min(len(jobs), os.cpu_count() or 1), thread_name_prefix="index") as executor:
+            for future in [executor.submit(self._write_index, *job) for job in jobs]:
+                future.result()
         
         # Generate and sign Release file
-        self._generate_release_file()
+        self._generate_release_file(list(buckets), architectures)
         
-    def _generate_packages_file(self, packages_path: str) -> None:
-        """Generate Packages file containing metadata for all .deb packages."""
-        logger.info("Generating Packages file")
+    def generate_combined_metadata(self, indices: Dict[str, PackageIndex]) -> None:
+        """
+        Generate metadata for a repository serving the packages of many repositories.
         
-        with open(packages_path, 'w') as f:
-            for deb_file in os.listdir(self.pool_dir):
-                if not deb_file.endswith('.deb'):
-                    continue
-                    
-                deb_path = os.path.join(self.pool_dir, deb_file)
-                metadata = self._extract_deb_metadata(deb_path)
+        The indices of the member repositories are merged, with each
+        Filename pointing into the member's own pool, so a single signed
+        Release covers all of them.
+        
+        Args:
+            indices: Package index of each member keyed by the member's path
+                relative to this repository (e.g. 'owner/repo')
+        """
+        index = PackageIndex()
+        for prefix, member_index in sorted(indices.items()):
+            index.merge(member_index, prefix)
+            
+        self.generate_metadata(index)
+        
+    @STAGE_SECONDS.time(stage='index')
+    def _update_index(self, index: PackageIndex = None) -> PackageIndex:
+        """
+        Bring the package index up to date with the pool.
+        
+        Stanzas are kept in the package index; only packages that are new or
+        whose checksum changed since the last build are parsed.
+        
+        Args:
+            index: Prebuilt package index to use as is
+        """
+        if index is not None:
+            logger.info(f"Using prebuilt index of {len(index)} packages")
+            self._report('index', packages=len(index))
+            return index
+        
+        logger.info("Indexing packages")
+        
+        index = PackageIndex(self.index_path)
+        current = []
+        updated = 0
+        
+        for deb_file in os.listdir(self.pool_dir):
+            if not deb_file.endswith('.deb'):
+                continue
                 
-                # Write package metadata
-                f.write(str(metadata))
-                f.write('\n\n')
+            deb_path = os.path.join(self.pool_dir, deb_file)
+            digest = self.digests.get(deb_file) or hash_file(deb_path)
+            updated += index.update(
+                deb_file,
+                digest.sha256,
+                lambda: str(self._extract_deb_metadata(deb_path, digest))
+            )
+            if deb_file in self.assets and deb_file not in self.unpublished_packages:
+                # Indexed by an earlier build that never published it; the stanza holds its control fields
+                self.unpublished_packages[deb_file] = CachedPackage(
+                    control=self._strip_index_fields(index.records[deb_file].stanza),
+                    digest=digest
+                )
+            current.append(deb_file)
+            
+        for deb_file, cached in self.cached_packages.items():
+            updated += index.update(
+                deb_file,
+                cached.digest.sha256,
+                lambda: str(self._add_index_fields(
+                    deb822.Deb822(cached.control), deb_file, cached.digest
+                ))
+            )
+            current.append(deb_file)
+            
+        removed = index.retain(current)
+        index.save()
+        
+        logger.info(f"Indexed {len(index)} packages ({updated} updated, {len(removed)} removed)")
+        self._report('index', packages=len(index), updated=updated, removed=len(removed))
+        return index
+        
+    def _write_index(self, component: str, arch: str, stanzas: List[str]) -> None:
+        """Write, compress and content-address the Packages index of one component and architecture."""
+        binary_dir = os.path.join(self.dists_dir, component, f"binary-{arch}")
+        os.makedirs(binary_dir, exist_ok=True)
+        
+        packages_path = os.path.join(binary_dir, "Packages")
+        count = write_stanzas(packages_path, stanzas)
+        logger.info(f"Wrote {count} packages to {component}/binary-{arch}")
+        
+        compressed_paths = self._compress_file(packages_path)
+        
+        # Content-addressed copies for Acquire-By-Hash clients
+        write_by_hash([packages_path] + compressed_paths)
                 
-    def _generate_release_file(self) -> None:
+    @STAGE_SECONDS.time(stage='release')
+    def _generate_release_file(self, components: List[str], architectures: List[str]) -> None:
         """Generate and sign Release file."""
         logger.info("Generating Release file")
         
         release_path = os.path.join(self.dists_dir, "Release")
         
-        checksums: Dict[str, List[Dict]] = {
-            'MD5Sum': [],
-            'SHA1': [],
-            'SHA256': []
-        }
-        
-        # Calculate checksums for all files in dists/
-        for root, _, files in os.walk(self.dists_dir):
+        # Collect all files in dists/ and hash each in a single read
+        relpaths = []
+        for root, dirs, files in os.walk(self.dists_dir):
+            # by-hash copies are addressed by their checksum and not listed in Release
+            dirs[:] = [d for d in dirs if d != 'by-hash']
             for filename in files:
-                if filename in ['Release', 'Release.gpg']:
+                if filename in ['Release', 'Release.gpg', 'InRelease']:
                     continue
-                    
-                filepath = os.path.join(root, filename)
-                relpath = os.path.relpath(filepath, self.dists_dir)
-                size = os.path.getsize(filepath)
+                relpaths.append(os.path.relpath(os.path.join(root, filename), self.dists_dir))
                 
-                with open(filepath, 'rb') as f:
-                    data = f.read()
-                    checksums['MD5Sum'].append({
-                        'hash': hashlib.md5(data).hexdigest(),
-                        'size': size,
-                        'path': relpath
-                    })
-                    checksums['SHA1'].append({
-                        'hash': hashlib.sha1(data).hexdigest(),
-                        'size': size,
-                        'path': relpath
-                    })
-                    checksums['SHA256'].append({
-                        'hash': hashlib.sha256(data).hexdigest(),
-                        'size': size,
-                        'path': relpath
-                    })
+        digests = dict(zip(relpaths, hash_files(os.path.join(self.dists_dir, p) for p in relpaths)))
         
         # Write Release file
         with open(release_path, 'w') as f:
@@ -181,58 +376,51 @@ class RepositoryService:
             f.write(f"Label: {self.repo_name} Repository\n")
             f.write("Suite: stable\n")
             f.write("Codename: stable\n")
-            f.write("Components: main\n")
-            f.write("Architectures: amd64\n")
+            f.write(f"Components: {' '.join(components)}\n")
+            f.write(f"Architectures: {' '.join(architectures)}\n")
             f.write(f"Date: {self._get_current_date()}\n")
+            f.write("Acquire-By-Hash: yes\n")
             
-            # Write checksums
-            for algo in ['MD5Sum', 'SHA1', 'SHA256']:
-                f.write(f"{algo}:\n")
-                for entry in sorted(checksums[algo], key=lambda x: x['path']):
-                    f.write(f" {entry['hash']} {entry['size']} {entry['path']}\n")
+            f.write(format_release_checksums(digests))
         
         logger.info("Release file generated")
         
         # Sign Release file if GPG is configured
-        if self.gpg_home and self.gpg_key_email:
+        if self.signer or (self.gpg_home and self.gpg_key_email):
             self._sign_release()
             
+    @STAGE_SECONDS.time(stage='sign')
     def _sign_release(self) -> None:
-        """Sign the Release file with GPG."""
+        """Write InRelease and Release.gpg from a single signature."""
         logger.info("Signing Release file")
         
-        gpg = gnupg.GPG(gnupghome=self.gpg_home)
-        release_path = os.path.join(self.dists_dir, "Release")
+        self._report('sign')
+        # The key is loaded once per process and shared by every build
+        signer = self.signer or load_signer(
+            os.path.join(self.gpg_home, PRIVATE_KEY_FILE),
+            self.gpg_key_email
+        )
+        signer.sign_release(os.path.join(self.dists_dir, "Release"))
+                
+    @STAGE_SECONDS.time(stage='compress')
+    def _compress_file(self, filepath: str) -> List[Path]:
+        """Create compressed versions of a file, encoding all formats from one read."""
+        self._report('compress', formats=self.compression_formats)
+        compressed_paths = compress_file(
+            filepath,
+            formats=self.compression_formats,
+            levels=self.compression_levels
+        )
+        for compressed_path in compressed_paths:
+            logger.debug(f"Created compressed file: {compressed_path}")
+        return compressed_paths
         
-        with open(release_path, 'rb') as f:
-            signed_data = gpg.sign_file(
-                f,
-                keyid=self.gpg_key_email,
-                detach=True,
-                output=os.path.join(self.dists_dir, "Release.gpg")
-            )
+    def _report(self, stage: str, **details) -> None:
+        if self.progress_callback:
+            self.progress_callback(stage, **details)
             
-            if not signed_data:
-                raise ValueError("Failed to sign Release file")
-                
-    def _compress_file(self, filepath: str) -> None:
-        """Create compressed versions of a file (gz and xz)."""
-        import gzip
-        import lzma
-        
-        # Create gzip version
-        gzip_path = filepath + '.gz'
-        with open(filepath, 'rb') as f_in:
-            with gzip.open(gzip_path, 'wb') as f_out:
-                f_out.write(f_in.read())
-        logger.debug(f"Created gzip compressed file: {gzip_path}")
-        
-        # Create xz version
-        xz_path = filepath + '.xz'
-        with open(filepath, 'rb') as f_in:
-            with lzma.open(xz_path, 'wb') as f_out:
-                f_out.write(f_in.read())
-        logger.debug(f"Created xz compressed file: {xz_path}")
+    def _report_download(self, task: DownloadTask, bytes_downloaded: int, total: Optional[int]) -> None:
+        self._report('download', asset=task.name, bytes=bytes_downloaded, total=total)
         
     @staticmethod
     def _get_current_date() -> str:
@@ -240,36 +428,46 @@ class RepositoryService:
         from datetime import datetime, timezone
         return datetime.now(timezone.utc).strftime("%a, %d %b %Y %H:%M:%S %Z")
 
-    def _extract_deb_metadata(self, deb_path: str) -> debfile.DebControl:
+    def _extract_deb_metadata(self, deb_path: str, digest: FileDigest = None) -> deb822.Deb822:
         """
         Extract metadata from a .deb file.
         
         Args:
             deb_path: Path to the .deb file
+            digest: Size and checksums recorded at download time. When omitted
+                the file is hashed in a single chunked pass.
             
         Returns:
-            DebControl object containing package metadata
+            Deb822 object containing package metadata
         """
-        # Parse package using python-debian
-        deb = debfile.DebFile(deb_path)
-        control_data = deb.control.debcontrol()
+        # Only the control member is read; data.tar is never decompressed
+        control_data = deb822.Deb822(read_control(deb_path, use_mmap=True))
         
-        # Add additional required fields
         filename = os.path.basename(deb_path)
-        size = os.path.getsize(deb_path)
+        if digest is None:
+            digest = hash_file(deb_path)
+            
+        # Remembered once published, so unchanged assets can skip download and parse
+        if filename in self.assets:
+            self.unpublished_packages[filename] = CachedPackage(control=control_data.dump(), digest=digest)
         
-        # Calculate checksums
-        with open(deb_path, 'rb') as f:
-            data = f.read()
-            md5sum = hashlib.md5(data).hexdigest()
-            sha1 = hashlib.sha1(data).hexdigest()
-            sha256 = hashlib.sha256(data).hexdigest()
+        return self._add_index_fields(control_data, filename, digest)
         
-        # Add fields required for the Packages file
+    @staticmethod
+    def _add_index_fields(control_data: deb822.Deb822, filename: str, digest: FileDigest) -> deb822.Deb822:
+        """Add the pool location and checksum fields required in a Packages stanza."""
         control_data['Filename'] = os.path.join('pool/main', filename)
-        control_data['Size'] = str(size)
-        control_data['MD5sum'] = md5sum
-        control_data['SHA1'] = sha1
-        control_data['SHA256'] = sha256
+        control_data['Size'] = str(digest.size)
+        control_data['MD5sum'] = digest.md5
+        control_data['SHA1'] = digest.sha1
+        control_data['SHA256'] = digest.sha256
+        
+        return control_data
         
-        return control_data 
\ No newline at end of file
+    @staticmethod
+    def _strip_index_fields(stanza: str) -> str:
+        """Control fields of a package from its Packages stanza"""
+        control_data = deb822.Deb822(stanza)
+        for field in INDEX_FIELDS:
+            control_data.pop(field, None)
+        return control_data.dump() 
\ No newline at end of file
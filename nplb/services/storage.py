@@ -1,10 +1,178 @@
 import boto3
+from boto3.s3.transfer import TransferConfig
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
-from typing import List
+from threading import BoundedSemaphore, Lock
+from typing import Callable, Dict, List, Optional
+import hashlib
 import mimetypes
 import os
+from botocore.config import Config
 from botocore.exceptions import ClientError
+from s3transfer.utils import ChunksizeAdjuster
 from time import sleep
+from .download import DownloadSink, NullSink
+from ..core.metrics import TRANSFER_BYTES
+from ..core.models import DebAsset
+
+# Publish stages in upload order; see S3StorageService._publish_stage
+PUBLISH_STAGES = ('pool', 'by-hash', 'indices', 'release', 'signatures')
+
+
+class S3StreamUpload:
+    """
+    Upload an object from chunks written to it, without a local file.
+    
+    Small objects are buffered and sent with a single PUT. Larger ones go
+    up as a multipart upload whose part size matches what upload_file uses,
+    so the object gets the ETag _local_etag computes for the same content.
+    At most max_pending parts are held in memory at a time, counting the
+    one being filled and those uploading: the writer blocks before starting
+    a new part until one has finished uploading. Full parts are handed to
+    the upload as they are, not copied, so an object never holds more than
+    max_pending parts plus the tail of the last write, whatever its size.
+    
+    Used as a download sink: write, then close to complete the object, or
+    abort to discard it. reset starts over when the source restarts.
+    """
+    
+    def __init__(
+        self,
+        service: 'S3StorageService',
+        key: str,
+        size: Optional[int] = None,
+        max_pending: int = 2
+    ):
+        self.service = service
+        self.key = key
+        self.size = size
+        config = service.transfer_config
+        # Known small objects fit one PUT, exactly as upload_file would send them
+        self.single_part = size is not None and size < config.multipart_threshold
+        self.chunksize = service._part_size(size) if size is not None else config.multipart_chunksize
+        self.max_pending = max(1, max_pending)
+        self._pending = BoundedSemaphore(self.max_pending)
+        # Whether the buffer being filled holds one of the max_pending slots
+        self._filling = False
+        self._buffer = bytearray()
+        self._upload_id: Optional[str] = None
+        self._parts: Dict[int, Future] = {}
+        self.bytes_written = 0
+    
+    def write(self, chunk: bytes) -> None:
+        if not self.single_part and not self._filling:
+            # Blocks the writer while max_pending parts are still in memory
+            self._pending.acquire()
+            self._filling = True
+        self._buffer += chunk
+        self.bytes_written += len(chunk)
+        if self.single_part:
+            return
+        while len(self._buffer) >= self.chunksize:
+            # The full buffer becomes the part; only the overflow is copied
+            part, self._buffer = self._buffer, self._buffer[self.chunksize:]
+            del part[self.chunksize:]
+            self._submit_part(part)
+            if self._buffer:
+                self._pending.acquire()
+                self._filling = True
+    
+    def _submit_part(self, data: bytearray) -> None:
+        # The slot held by the filled buffer passes to the part's upload
+        self._filling = False
+        try:
+            if self._upload_id is None:
+                self._upload_id = self.service.client.create_multipart_upload(
+                    Bucket=self.service.bucket_name,
+                    Key=self.key,
+                    **self.service._extra_args(self.key)
+                )['UploadId']
+            number = len(self._parts) + 1
+            self._parts[number] = self.service._part_executor().submit(self._upload_part, number, data)
+        except BaseException:
+            self._pending.release()
+            raise
+    
+    def _upload_part(self, number: int, data: bytearray) -> str:
+        try:
+            response = self.service.client.upload_part(
+                Bucket=self.service.bucket_name,
+                Key=self.key,
+                UploadId=self._upload_id,
+                PartNumber=number,
+                Body=data
+            )
+            TRANSFER_BYTES.inc(len(data), direction='upload')
+            return response['ETag']
+        finally:
+            self._pending.release()
+    
+    def close(self) -> str:
+        """
+        Complete the object.
+        
+        Returns:
+            Key of the uploaded object
+        """
+        if self.size is not None and self.bytes_written != self.size:
+            raise ValueError(f"Wrote {self.bytes_written} bytes to {self.key}, expected {self.size}")
+        
+        if self._upload_id is None:
+            self.service.client.put_object(
+                Bucket=self.service.bucket_name,
+                Key=self.key,
+                Body=bytes(self._buffer),
+                **self.service._extra_args(self.key)
+            )
+            TRANSFER_BYTES.inc(len(self._buffer), direction='upload')
+            self._release_filling()
+        else:
+            if self._buffer:
+                self._submit_part(self._buffer)
+                self._buffer = bytearray()
+            parts = [
+                {'PartNumber': number, 'ETag': future.result()}
+                for number, future in sorted(self._parts.items())
+            ]
+            self.service.client.complete_multipart_upload(
+                Bucket=self.service.bucket_name,
+                Key=self.key,
+                UploadId=self._upload_id,
+                MultipartUpload={'Parts': parts}
+            )
+        
+        print(f"Streamed {self.bytes_written} bytes to {self.key}")
+        self._clear()
+        return self.key
+    
+    def abort(self) -> None:
+        """Discard everything written, including parts already uploaded."""
+        for future in self._parts.values():
+            # Parts still uploading would otherwise outlive the abort
+            future.exception()
+        if self._upload_id is not None:
+            self.service.client.abort_multipart_upload(
+                Bucket=self.service.bucket_name,
+                Key=self.key,
+                UploadId=self._upload_id
+            )
+        self._clear()
+    
+    def reset(self) -> None:
+        """Start the object over; the source is being read again from the beginning."""
+        self.abort()
+    
+    def _release_filling(self) -> None:
+        if self._filling:
+            self._filling = False
+            self._pending.release()
+    
+    def _clear(self) -> None:
+        self._release_filling()
+        self._buffer = bytearray()
+        self._upload_id = None
+        self._parts = {}
+        self.bytes_written = 0
 
 class S3StorageService:
     def __init__(
@@ -12,33 +180,143 @@ class S3StorageService:
         access_key_id: str,
         secret_access_key: str,
         bucket_name: str,
-        region: str
+        region: str,
+        max_concurrency: int = 8,
+        multipart_threshold: int = 8 * 1024 * 1024,
+        multipart_chunksize: int = 8 * 1024 * 1024,
+        stream_buffers: int = 2
     ):
         self.bucket_name = bucket_name
+        self.max_concurrency = max(1, max_concurrency)
+        # Parts each streamed upload holds in memory, filling or uploading
+        self.stream_buffers = max(1, stream_buffers)
+        self.transfer_config = TransferConfig(
+            multipart_threshold=multipart_threshold,
+            multipart_chunksize=multipart_chunksize,
+            max_concurrency=self.max_concurrency
+        )
         self.client = boto3.client(
             's3',
             aws_access_key_id=access_key_id,
             aws_secret_access_key=secret_access_key,
-            region_name=region
+            region_name=region,
+            # File uploads and streamed parts each use at most max_concurrency
+            # connections; the rest is for the create/complete calls streamed
+            # uploads make from download threads
+            config=Config(max_pool_connections=self.max_concurrency * 2)
         )
+        self._parts_executor: Optional[ThreadPoolExecutor] = None
+        self._parts_executor_lock = Lock()
 
     def _get_content_type(self, filename: str) -> str:
         content_type, _ = mimetypes.guess_type(filename)
         return content_type or 'application/octet-stream'
 
-    def upload_file(self, file_path: str | Path, key: str, max_retries: int = 5) -> str:
-        """Upload a single file to S3"""
+    @staticmethod
+    def _cache_control(key: str) -> str | None:
+        """
+        Cache policy for a repository object.
+        
+        by-hash indices are content-addressed and never change once written,
+        so caches may keep them indefinitely. Release files and the
+        canonically named indices are rewritten on every publish, and pool
+        packages are keyed by asset name, which a maintainer can re-upload
+        on GitHub with new contents; all of these must be revalidated.
+        """
+        parts = Path(key).parts
+        if 'by-hash' in parts:
+            return 'public, max-age=31536000, immutable'
+        if 'pool' in parts or parts[-1] in ['Release', 'InRelease', 'Release.gpg'] or parts[-1].startswith('Packages'):
+            return 'no-cache'
+        return None
+
+    def _extra_args(self, key: str) -> Dict[str, str]:
+        """Content type and cache policy of an object"""
+        extra_args = {
+            'ContentType': self._get_content_type(key)
+        }
+        
+        cache_control = self._cache_control(key)
+        if cache_control:
+            extra_args['CacheControl'] = cache_control
+        return extra_args
+
+    def _part_executor(self) -> ThreadPoolExecutor:
+        """Threads uploading the parts of every streamed object"""
+        with self._parts_executor_lock:
+            if self._parts_executor is None:
+                self._parts_executor = ThreadPoolExecutor(
+                    max_workers=self.max_concurrency,
+                    thread_name_prefix="s3-part"
+                )
+            return self._parts_executor
+
+    def _transfer_config(self, max_concurrency: int) -> TransferConfig:
+        """Our TransferConfig with a different number of threads per file"""
+        return TransferConfig(
+            multipart_threshold=self.transfer_config.multipart_threshold,
+            multipart_chunksize=self.transfer_config.multipart_chunksize,
+            max_concurrency=max(1, max_concurrency)
+        )
+
+    def _part_size(self, size: int) -> int:
+        """Multipart part size used for an object of size bytes"""
+        return ChunksizeAdjuster().adjust_chunksize(self.transfer_config.multipart_chunksize, size)
+
+    def open_upload(self, key: str, size: Optional[int] = None) -> S3StreamUpload:
+        """
+        Start an upload fed chunk by chunk, e.g. straight from a download.
+        
+        Nothing is sent until data is written; close the returned upload to
+        complete the object or abort it to discard it.
+        
+        Args:
+            key: Object key
+            size: Size of the object when known; verified on close
+        """
+        return S3StreamUpload(self, key, size, max_pending=self.stream_buffers)
+
+    def pool_uploads(self, prefix: str) -> Callable[[DebAsset], DownloadSink]:
+        """
+        Sinks streaming release assets into the pool under prefix.
+        
+        The pool is listed once. An asset whose object already has its size
+        and was written after GitHub last updated the asset is unchanged
+        (GitHub bumps updated_at on every re-upload), so it gets a sink
+        that discards it instead of uploading it again.
+        
+        Args:
+            prefix: Pool directory, e.g. owner/repo/pool/main
+        """
+        remote = self.list_objects(f"{prefix}/")
+        
+        def open_sink(asset: DebAsset) -> DownloadSink:
+            key = f"{prefix}/{asset.name}"
+            existing = remote.get(key)
+            if (existing and existing['Size'] == asset.size
+                    and asset.updated_at and existing['LastModified'] >= asset.updated_at):
+                print(f"Skipping unchanged {key}")
+                return NullSink()
+            return self.open_upload(key, asset.size)
+        
+        return open_sink
+
+    def upload_file(
+        self,
+        file_path: str | Path,
+        key: str,
+        max_retries: int = 5,
+        config: Optional[TransferConfig] = None
+    ) -> str:
+        """Upload a single file to S3, with config's multipart threads if given"""
         file_path = Path(file_path).resolve()
         print(f"Uploading {file_path} to {key}")
+        # Content type is guessed from the local name, as it always has been
         extra_args = {
+            **self._extra_args(key),
             'ContentType': self._get_content_type(str(file_path))
         }
         
-        # If the file is a Release or Packages file, set cache control
-        if file_path.name in ['Release', 'InRelease', 'Packages', 'Packages.gz', 'Packages.xz']:
-            extra_args['CacheControl'] = 'no-cache, no-store, must-revalidate'
-            extra_args['Expires'] = '0'
-        
         retry_count = 0
         while retry_count < max_retries:
             try:
@@ -47,7 +325,8 @@ class S3StorageService:
                     str(file_path),
                     self.bucket_name,
                     key,
-                    ExtraArgs=extra_args
+                    ExtraArgs=extra_args,
+                    Config=config or self.transfer_config
                 )
                 return key
             except ClientError as e:
@@ -70,19 +349,222 @@ class S3StorageService:
 
         raise Exception(f"Failed to upload {file_path} after {max_retries} attempts")
 
-    def upload_directory(self, directory: str | Path, prefix: str = "") -> List[str]:
-        """Upload an entire directory to S3"""
-        directory = Path(directory)
-        uploaded_files = []
+    def list_objects(self, prefix: str = "") -> Dict[str, Dict]:
+        """List size and ETag of every object under prefix in one paginated pass"""
+        objects = {}
+        paginator = self.client.get_paginator('list_objects_v2')
+        
+        for page in paginator.paginate(Bucket=self.bucket_name, Prefix=prefix):
+            for obj in page.get('Contents', []):
+                objects[obj['Key']] = {
+                    'ETag': obj['ETag'].strip('"'),
+                    'Size': obj['Size'],
+                    'LastModified': obj['LastModified']
+                }
+        
+        return objects
+
+    def get_object(self, key: str) -> bytes | None:
+        """Contents of an object, or None if it does not exist"""
+        try:
+            response = self.client.get_object(Bucket=self.bucket_name, Key=key)
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code', '') in ['NoSuchKey', '404']:
+                return None
+            raise
+        data = response['Body'].read()
+        TRANSFER_BYTES.inc(len(data), direction='download')
+        return data
+
+    def _list_published(self, directory: Path, files: Dict[str, Path], prefix: str) -> Dict[str, Dict]:
+        """
+        List the remote objects that files can overwrite.
+        
+        Only the top-level paths files are published under (e.g. dists/ and
+        pool/) are listed, so publishing at the bucket root does not list
+        every other repository in the bucket.
+        """
+        remote = {}
+        for top in sorted({file_path.relative_to(directory).parts[0] for file_path in files.values()}):
+            key = str(Path(prefix) / top)
+            remote.update(self.list_objects(key + '/' if (directory / top).is_dir() else key))
+        return remote
+
+    def _local_etag(self, file_path: Path) -> str:
+        """Compute the ETag S3 assigns to file_path when uploaded with our TransferConfig"""
+        size = file_path.stat().st_size
+        config = self.transfer_config
+        
+        if size < config.multipart_threshold:
+            md5 = hashlib.md5()
+            with open(file_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    md5.update(chunk)
+            return md5.hexdigest()
         
-        for root, _, files in os.walk(directory):
-            for file in files:
+        # Multipart ETag: MD5 of the concatenated part MD5s, suffixed with the part count
+        chunksize = self._part_size(size)
+        part_digests = []
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunksize), b''):
+                part_digests.append(hashlib.md5(chunk).digest())
+        return f"{hashlib.md5(b''.join(part_digests)).hexdigest()}-{len(part_digests)}"
+
+    def _is_unchanged(self, file_path: Path, remote: Dict) -> bool:
+        if remote is None or remote['Size'] != file_path.stat().st_size:
+            return False
+        return remote['ETag'] == self._local_etag(file_path)
+
+    def _collect_files(self, directory: Path, prefix: str) -> Dict[str, Path]:
+        """Map S3 key to local path for every file in directory, skipping dotfiles"""
+        files = {}
+        
+        for root, dirnames, filenames in os.walk(directory):
+            dirnames[:] = [d for d in dirnames if not d.startswith('.')]
+            for file in filenames:
+                if file.startswith('.'):
+                    continue
                 file_path = Path(root) / file
                 relative_path = file_path.relative_to(directory)
-                key = str(Path(prefix) / relative_path)
-                
-                self.upload_file(file_path, key)
-                uploaded_files.append(key)
+                files[str(Path(prefix) / relative_path)] = file_path
+        
+        return files
+
+    def _sync_file(self, file_path: Path, key: str, remote: Dict | None, config: TransferConfig) -> str | None:
+        if remote is not None and self._is_unchanged(file_path, remote.get(key)):
+            return None
+        uploaded = self.upload_file(file_path, key, config=config)
+        TRANSFER_BYTES.inc(file_path.stat().st_size, direction='upload')
+        return uploaded
+
+    def _upload_files(self, files: Dict[str, Path], remote: Dict | None = None) -> List[str]:
+        """
+        Upload files concurrently, skipping those unchanged in the remote listing.
+        
+        Files and their multipart parts share max_concurrency connections:
+        with few files each gets several part threads, with many each gets
+        one, so no more requests are in flight than the client has pooled
+        connections for.
+        
+        Returns:
+            Keys that were uploaded
+        """
+        if not files:
+            return []
+        
+        workers = min(self.max_concurrency, len(files))
+        config = self._transfer_config(self.max_concurrency // workers)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(self._sync_file, file_path, key, remote, config)
+                for key, file_path in sorted(files.items())
+            ]
+            uploaded_files = [key for key in (future.result() for future in futures) if key]
+        
+        print(f"Uploaded {len(uploaded_files)} files, skipped {len(files) - len(uploaded_files)} unchanged")
+        return uploaded_files
+
+    def upload_directory(self, directory: str | Path, prefix: str = "", skip_unchanged: bool = True) -> List[str]:
+        """
+        Upload an entire directory to S3
+        
+        Files are uploaded concurrently. With skip_unchanged, the remote
+        listing is fetched once and files whose size and ETag already match
+        the remote object are skipped.
+        
+        Returns:
+            Keys that were uploaded
+        """
+        directory = Path(directory)
+        files = self._collect_files(directory, prefix)
+        remote = self._list_published(directory, files, prefix) if skip_unchanged else None
+        return self._upload_files(files, remote)
+
+    @staticmethod
+    def _publish_stage(relative_path: Path) -> int:
+        """Position of a repository file in the publish order"""
+        if relative_path.parts[0] == 'pool':
+            return 0
+        if 'by-hash' in relative_path.parts:
+            return 1
+        if relative_path.name == 'Release':
+            return 3
+        if relative_path.name in ('InRelease', 'Release.gpg'):
+            return 4
+        return 2
+
+    def _prune_by_hash(self, files: Dict[str, Path], remote: Dict[str, Dict], retention: int) -> None:
+        """Delete remote by-hash objects older than the newest retention generations"""
+        current: Dict[str, set] = {}
+        for key in files:
+            if 'by-hash' in Path(key).parts:
+                current.setdefault(str(Path(key).parent), set()).add(key)
+        
+        stale = []
+        for by_hash_dir, keys in current.items():
+            # One generation is one copy of every index next to by-hash/
+            index_dir = str(Path(by_hash_dir).parent.parent)
+            generation_size = sum(1 for key in files if str(Path(key).parent) == index_dir) or len(keys)
+            
+            previous = sorted(
+                (key for key in remote if str(Path(key).parent) == by_hash_dir and key not in keys),
+                key=lambda key: remote[key]['LastModified'],
+                reverse=True
+            )
+            # Local copies are the newest and count towards retention
+            stale.extend(previous[max(max(retention, 1) * generation_size - len(keys), 0):])
+        
+        for i in range(0, len(stale), 1000):
+            print(f"Pruning {len(stale[i:i + 1000])} old by-hash objects")
+            self.client.delete_objects(
+                Bucket=self.bucket_name,
+                Delete={'Objects': [{'Key': key} for key in stale[i:i + 1000]]}
+            )
+
+    def publish_repository(
+        self,
+        directory: str | Path,
+        prefix: str = "",
+        by_hash_retention: int = 3,
+        progress_callback: Callable[..., None] | None = None
+    ) -> List[str]:
+        """
+        Publish an APT repository so clients never see dangling references
+        
+        Files are uploaded in dependency order, each stage completing before
+        the next starts: pool packages, by-hash indices, the remaining
+        indices, Release, then both signatures, InRelease and Release.gpg,
+        so neither signed form vouches for anything missing. Files within a
+        stage are uploaded concurrently and unchanged files are skipped. If
+        a stage fails, later stages are not uploaded, so the published
+        Release keeps pointing at the previous, complete set of indices.
+        
+        Once the signatures are published, by-hash objects older than the
+        newest by_hash_retention generations are deleted.
+        
+        progress_callback, if given, is called as ('upload', publish_stage=...,
+        uploaded=..., files=...) after each stage completes.
+        
+        Returns:
+            Keys that were uploaded
+        """
+        directory = Path(directory)
+        files = self._collect_files(directory, prefix)
+        remote = self._list_published(directory, files, prefix)
+        
+        stages: List[Dict[str, Path]] = [{} for _ in PUBLISH_STAGES]
+        for key, file_path in files.items():
+            stage = self._publish_stage(file_path.relative_to(directory))
+            stages[stage][key] = file_path
+        
+        uploaded_files = []
+        for name, stage_files in zip(PUBLISH_STAGES, stages):
+            uploaded = self._upload_files(stage_files, remote)
+            uploaded_files.extend(uploaded)
+            if progress_callback:
+                progress_callback('upload', publish_stage=name, uploaded=len(uploaded), files=len(stage_files))
+        
+        self._prune_by_hash(files, remote, by_hash_retention)
         
         return uploaded_files
 
@@ -1,33 +1,177 @@
-from nplb.services.github import GitHubService
-from nplb.services.repository import RepositoryService
-from nplb.core.config import get_settings, Settings
+import asyncio
+import time
+from datetime import datetime, timezone
+from functools import wraps
+from typing import List
+from rq import get_current_job
+from nplb.core.config import get_settings
+from nplb.core.metrics import JOB_SECONDS, QUEUE_WAIT_SECONDS, STAGE_SECONDS, push_metrics
+from nplb.resources.progress import ProgressReporter
+from nplb.resources.queue import last_fingerprint, record_fingerprint, release_job_key
+from nplb.services.github import release_fingerprint
+from nplb.services.index import read_published_index
+from nplb.resources.services import (
+    create_aggregate_service,
+    create_repository_service,
+    get_github_service,
+    get_storage_service,
+)
 from loguru import logger
 from .exceptions import BuildRepositoryError
 
-def build_repository_task(owner: str, repo: str, limit: int = 1, github_service: GitHubService = None, repo_service: RepositoryService = None):
-    """Build a Debian repository from GitHub releases."""
+# Job arguments are plain values only. Services are built in the worker from
+# per-process instances, so payloads stay small and connection pools are
+# reused across jobs.
+
+def _progress_reporter():
+    """Progress reporter of the running job; a no-op when run outside RQ"""
+    return ProgressReporter.for_current_job() or (lambda stage, **details: None)
+
+def _as_utc(moment: datetime) -> datetime:
+    # RQ stores some job timestamps naive (in UTC) and others aware
+    return moment.replace(tzinfo=timezone.utc) if moment.tzinfo is None else moment
+
+def _instrumented(task_name: str):
+    """Record queue wait and run time of a task, then push this worker's metrics"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            job = get_current_job()
+            if job and job.enqueued_at and job.started_at:
+                waited = _as_utc(job.started_at) - _as_utc(job.enqueued_at)
+                QUEUE_WAIT_SECONDS.observe(max(waited.total_seconds(), 0.0), task=task_name)
+            
+            outcome = 'failed'
+            start = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+                outcome = 'succeeded'
+                return result
+            finally:
+                JOB_SECONDS.observe(time.perf_counter() - start, task=task_name, outcome=outcome)
+                if job:
+                    try:
+                        push_metrics(job.connection)
+                    except Exception as e:
+                        logger.warning(f"Failed to push metrics: {str(e)}")
+        return wrapper
+    return decorator
+
+@_instrumented('build')
+def build_repository_task(owner: str, repo: str, limit: int = 1, publish: bool = True, index_only: bool = False):
+    """
+    Build a Debian repository from GitHub releases and publish it to S3.
+    
+    With index_only the pool is expected to be published already: packages
+    are streamed through hashing and control extraction without being
+    written to local disk, and only the indices and Release are published.
+    
+    Run as a deduplicated job, the build is skipped when the releases are
+    the ones the last build under the same job key published.
+    """
+    report = _progress_reporter()
     try:
+        github_service = get_github_service()
+        repo_service = create_repository_service(owner, repo, progress_callback=report)
         
         # Get repository releases
-        releases = github_service.get_releases(owner, repo, limit)
+        with STAGE_SECONDS.time(stage='releases'):
+            releases = asyncio.run(github_service.get_releases(owner, repo, limit))
+        job = get_current_job()
+        if job:
+            # Requests from now on may follow a newer release than we fetched
+            release_job_key(job)
         if not releases:
             raise ValueError(f"No releases found for {owner}/{repo}")
+        fingerprint = release_fingerprint(releases)
+        report('releases', releases=len(releases), assets=sum(len(release.assets) for release in releases))
+        
+        if publish and job and last_fingerprint(job) == fingerprint:
+            logger.info(f"Releases of {owner}/{repo} are unchanged since the last build, skipping it")
+            report('finished', unchanged=True)
+            return
         
         try:
             # Create repository structure
             repo_service.create_repository()
             
-            # Download release artifacts
-            repo_service.download_artifacts(releases)
+            # Download release artifacts, streaming pool objects straight to S3 when publishing
+            settings = get_settings()
+            pool_sink = None
+            if publish and not index_only and settings.direct_pool_upload:
+                pool_sink = get_storage_service().pool_uploads(f"{owner}/{repo}/pool/main")
+            repo_service.download_artifacts(releases, index_only=index_only, pool_sink=pool_sink)
             
             # Generate metadata
             repo_service.generate_metadata()
             
+            # Publish pool, indices and Release in dependency order
+            if publish:
+                with STAGE_SECONDS.time(stage='publish'):
+                    get_storage_service().publish_repository(
+                        repo_service.temp_dir,
+                        prefix=f"{owner}/{repo}",
+                        by_hash_retention=settings.by_hash_retention,
+                        progress_callback=report
+                    )
+                repo_service.commit_package_cache()
+                if job:
+                    record_fingerprint(job, fingerprint)
+            
         finally:
             # Clean up temporary files
             pass
             repo_service.cleanup()
         
+        report('finished')
+        
     except Exception as e:
         logger.error(f"Failed to build repository: {str(e)}")
-        raise BuildRepositoryError(f"Failed to build repository: {str(e)}")
\ No newline at end of file
+        report('failed', error=str(e))
+        raise BuildRepositoryError(f"Failed to build repository: {str(e)}")
+
+@_instrumented('aggregate')
+def aggregate_repositories_task(repositories: List[str], publish: bool = True):
+    """
+    Merge the package indices of many built repositories into one signed repository.
+    
+    Runs after the per-repository build jobs of a batch. Each member's
+    index is read back from its published dists/ in S3, which every worker
+    can reach, so the aggregate need not run where the members were built.
+    If any member has no complete published index the task fails and the
+    previous combined repository stays in place.
+    
+    The combined repository is published at the bucket root, with each
+    package's Filename pointing into its own repository's pool.
+    """
+    report = _progress_reporter()
+    try:
+        settings = get_settings()
+        storage = get_storage_service()
+        indices = {
+            repository: read_published_index(storage.get_object, f"{repository}/dists/stable")
+            for repository in repositories
+        }
+        repo_service = create_aggregate_service(progress_callback=report)
+        
+        try:
+            repo_service.create_repository()
+            repo_service.generate_combined_metadata(indices)
+            
+            # A single writer publishes the combined dists/ for the whole batch
+            if publish:
+                with STAGE_SECONDS.time(stage='publish'):
+                    storage.publish_repository(
+                        repo_service.temp_dir,
+                        by_hash_retention=settings.by_hash_retention,
+                        progress_callback=report
+                    )
+        finally:
+            repo_service.cleanup()
+        
+        report('finished')
+    
+    except Exception as e:
+        logger.error(f"Failed to aggregate repositories: {str(e)}")
+        report('failed', error=str(e))
+        raise BuildRepositoryError(f"Failed to aggregate repositories: {str(e)}")
@@ -0,0 +1,120 @@
+from pathlib import Path
+import io
+import lzma
+import tarfile
+import tempfile
+import unittest
+import zstandard
+from debian.debfile import DebFile
+from nplb.core.deb import ControlReader, DebFormatError, read_control
+
+CONTROL = (
+    "Package: hello\n"
+    "Version: 1:2.10-3\n"
+    "Architecture: amd64\n"
+    "Maintainer: Example <dev@example.com>\n"
+    "Description: greet\n"
+    " Prints a greeting.\n"
+)
+
+
+def ar_member(name: str, data: bytes) -> bytes:
+    header = f"{name:<16}{0:<12}{0:<6}{0:<6}{0o100644:<8o}{len(data):<10}`\n".encode('ascii')
+    return header + data + (b"\n" if len(data) % 2 else b"")
+
+
+def tar(files: dict, compression: str = '') -> bytes:
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w:gz' if compression == 'gz' else 'w') as archive:
+        for name, data in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+    data = buffer.getvalue()
+    if compression == 'xz':
+        return lzma.compress(data)
+    if compression == 'zst':
+        return zstandard.ZstdCompressor().compress(data)
+    return data
+
+
+def deb(compression: str, control: str = CONTROL, extra_member: bytes = b"") -> bytes:
+    control_name = 'control.tar' + (f".{compression}" if compression else '')
+    return (
+        b"!<arch>\n"
+        + ar_member("debian-binary", b"2.0\n")
+        + extra_member
+        + ar_member(control_name, tar({"./control": control.encode(), "./md5sums": b""}, compression))
+        + ar_member("data.tar.xz", tar({"./usr/bin/hello": b"\x7fELF" * 1000}, 'xz'))
+    )
+
+
+def feed(data: bytes, chunk_size: int) -> ControlReader:
+    reader = ControlReader()
+    for i in range(0, len(data), chunk_size):
+        reader.feed(data[i:i + chunk_size])
+    return reader
+
+
+class ControlReaderTest(unittest.TestCase):
+    """ControlReader must capture what python-debian reads from the same package"""
+
+    COMPRESSIONS = ('gz', 'xz', 'zst', '')
+    CHUNK_SIZES = (1, 7, 60, 61, 4096)
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def expected(self, data: bytes) -> str:
+        path = Path(self.directory.name) / "package.deb"
+        path.write_bytes(data)
+        return DebFile(str(path)).control.get_content('control', encoding='utf-8')
+
+    def test_matches_python_debian(self):
+        for compression in self.COMPRESSIONS:
+            data = deb(compression)
+            expected = self.expected(data)
+            self.assertEqual(expected, CONTROL)
+            for chunk_size in self.CHUNK_SIZES:
+                with self.subTest(compression=compression or 'none', chunk_size=chunk_size):
+                    self.assertEqual(feed(data, chunk_size).result(), expected)
+
+    def test_skips_odd_sized_members_before_control(self):
+        # Members are 2-byte aligned; an odd one is followed by a padding byte
+        data = deb('xz', extra_member=ar_member("_extra", b"odd"))
+        expected = self.expected(data)
+        for chunk_size in self.CHUNK_SIZES:
+            with self.subTest(chunk_size=chunk_size):
+                self.assertEqual(feed(data, chunk_size).result(), expected)
+
+    def test_matches_read_control(self):
+        for compression in self.COMPRESSIONS:
+            path = Path(self.directory.name) / f"package-{compression or 'none'}.deb"
+            path.write_bytes(deb(compression))
+            for use_mmap in (False, True):
+                with self.subTest(compression=compression or 'none', use_mmap=use_mmap):
+                    self.assertEqual(read_control(path, use_mmap=use_mmap), feed(path.read_bytes(), 1000).result())
+
+    def test_reset_starts_over(self):
+        data = deb('gz')
+        reader = feed(data[:len(data) // 3], 13)
+        reader.reset()
+        for i in range(0, len(data), 13):
+            reader.feed(data[i:i + 13])
+        self.assertEqual(reader.result(), CONTROL)
+
+    def test_rejects_what_is_not_a_package(self):
+        with self.assertRaises(DebFormatError):
+            feed(b"PK\x03\x04" + b"\0" * 100, 7)
+
+    def test_truncated_stream_has_no_control(self):
+        data = deb('xz')
+        control_start = data.index(b"control.tar.xz")
+        reader = feed(data[:control_start + 100], 7)
+        with self.assertRaises(DebFormatError):
+            reader.result()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,213 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from threading import Thread
+import hashlib
+import socket
+import tempfile
+import unittest
+from benchmarks.fixtures import make_deb
+from nplb.core.deb import read_control
+from nplb.services.download import DownloadManager, DownloadTask
+
+
+class AssetServer:
+    """
+    Serves one asset, misbehaving as scripted.
+
+    Each request takes the next behaviour from the script ('ok' once it runs out):
+    ok honours Range and If-Range, drop sends the headers of the full response
+    and closes the connection after cut bytes, close ends a response without
+    Content-Length after cut bytes, ignore-range always answers 200 in full,
+    and change replaces the asset (and its ETag) with replacement before
+    answering.
+    """
+
+    def __init__(self, data: bytes, script, cut: int, replacement: bytes = b""):
+        self.data = data
+        self.replacement = replacement
+        self.etag = self._etag(data)
+        self.script = list(script)
+        self.cut = cut
+        self.requests = []
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self.server.daemon_threads = True
+        Thread(target=self.server.serve_forever, daemon=True).start()
+
+    @staticmethod
+    def _etag(data: bytes) -> str:
+        return f'"{hashlib.md5(data).hexdigest()}"'
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1]}/asset.deb"
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _handler(self):
+        asset = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                behaviour = asset.script.pop(0) if asset.script else 'ok'
+                asset.requests.append({'behaviour': behaviour, **dict(self.headers)})
+                if behaviour == 'change':
+                    asset.data = asset.replacement
+                    asset.etag = asset._etag(asset.data)
+
+                start = 0
+                range_header = self.headers.get('Range')
+                if_range = self.headers.get('If-Range')
+                if range_header and behaviour != 'ignore-range' and if_range in (None, asset.etag):
+                    start = int(range_header.split('=')[1].rstrip('-'))
+                body = asset.data[start:]
+
+                self.send_response(206 if start else 200)
+                self.send_header('ETag', asset.etag)
+                if start:
+                    self.send_header('Content-Range', f"bytes {start}-{len(asset.data) - 1}/{len(asset.data)}")
+                if behaviour == 'close':
+                    self.send_header('Connection', 'close')
+                    self.end_headers()
+                    self.wfile.write(body[:asset.cut])
+                    self.close_connection = True
+                    return
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                if behaviour == 'drop':
+                    self.wfile.write(body[:asset.cut])
+                    self.wfile.flush()
+                    self.connection.shutdown(socket.SHUT_RDWR)
+                    self.close_connection = True
+                    return
+                self.wfile.write(body)
+
+        return Handler
+
+
+class RecordingSink:
+    def __init__(self):
+        self.data = bytearray()
+        self.resets = 0
+        self.closed = False
+        self.aborted = False
+
+    def write(self, chunk: bytes):
+        self.data += chunk
+
+    def reset(self):
+        self.resets += 1
+        self.data.clear()
+
+    def close(self):
+        self.closed = True
+
+    def abort(self):
+        self.aborted = True
+
+
+class DownloadResumeTest(unittest.TestCase):
+    # A whole number of chunks; a partial last chunk is lost with the connection
+    CUT = 16 * 4096
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        self.package = make_deb(self.directory / "source.deb", "hello", "1.0", "amd64", 200_000, seed=1)
+        self.data = self.package.read_bytes()
+        self.manager = DownloadManager(max_workers=1, retries=3, backoff=0, chunk_size=4096, timeout=(5, 5))
+
+    def serve(self, *script, cut: int = CUT, replacement: bytes = b"") -> AssetServer:
+        server = AssetServer(self.data, script, cut, replacement)
+        self.addCleanup(server.stop)
+        return server
+
+    def download(self, server: AssetServer, size=None, **kwargs):
+        task = DownloadTask(
+            name="asset.deb",
+            url=server.url,
+            dest_path=str(self.directory / "pool" / "asset.deb"),
+            size=len(self.data) if size is None else size,
+            extract_control=True,
+            sink=RecordingSink(),
+            **kwargs
+        )
+        (self.directory / "pool").mkdir(exist_ok=True)
+        return self.manager.download(task)
+
+    def assertLeftNoPartFile(self):
+        self.assertEqual([path.name for path in (self.directory / "pool").iterdir() if path.name.startswith('.')], [])
+
+    def assertDownloaded(self, result, data: bytes):
+        self.assertTrue(result.ok, result.error)
+        self.assertEqual(Path(result.task.dest_path).read_bytes(), data)
+        self.assertEqual(result.digest.sha256, hashlib.sha256(data).hexdigest())
+        self.assertEqual(bytes(result.task.sink.data), data)
+        self.assertTrue(result.task.sink.closed)
+        self.assertLeftNoPartFile()
+
+    def test_resumes_after_dropped_connection(self):
+        server = self.serve('drop', 'ok')
+        result = self.download(server)
+        self.assertDownloaded(result, self.data)
+        self.assertEqual(result.control, read_control(self.package))
+        self.assertEqual(server.requests[1]['Range'], f"bytes={self.CUT}-")
+        self.assertEqual(server.requests[1]['If-Range'], server.etag)
+        # Nothing was fetched twice
+        self.assertEqual(result.bytes_downloaded, len(self.data))
+        self.assertEqual(result.task.sink.resets, 0)
+
+    def test_resumes_after_response_ends_short(self):
+        # Without Content-Length only the expected size reveals the truncation
+        server = self.serve('close', 'ok')
+        result = self.download(server)
+        self.assertDownloaded(result, self.data)
+        self.assertEqual(server.requests[1]['Range'], f"bytes={self.CUT}-")
+
+    def test_restarts_when_server_ignores_range(self):
+        server = self.serve('drop', 'ignore-range')
+        result = self.download(server)
+        self.assertDownloaded(result, self.data)
+        self.assertEqual(result.control, read_control(self.package))
+        self.assertEqual(result.bytes_downloaded, self.CUT + len(self.data))
+        self.assertEqual(result.task.sink.resets, 1)
+
+    def test_restarts_when_asset_changed(self):
+        changed = make_deb(self.directory / "changed.deb", "hello", "1.1", "amd64", 200_000, seed=2)
+        server = self.serve('drop', 'change', replacement=changed.read_bytes())
+        result = self.download(server, size=changed.stat().st_size)
+        # If-Range carried the old ETag, so the server sent the new asset in full
+        self.assertEqual(server.requests[1]['If-Range'], AssetServer._etag(self.data))
+        self.assertDownloaded(result, changed.read_bytes())
+        self.assertEqual(result.control, read_control(changed))
+        self.assertEqual(result.task.sink.resets, 1)
+
+    def test_gives_up_and_cleans_up(self):
+        # Each attempt gets a little further, but never to the end
+        server = self.serve('drop', 'drop', 'drop', 'drop', cut=4096)
+        result = self.download(server)
+        self.assertFalse(result.ok)
+        self.assertEqual(len(server.requests), self.manager.retries + 1)
+        self.assertFalse(Path(result.task.dest_path).exists())
+        self.assertLeftNoPartFile()
+        self.assertTrue(result.task.sink.aborted)
+        self.assertFalse(result.task.sink.closed)
+
+    def test_oversized_response_is_not_retried(self):
+        server = self.serve('ok')
+        result = self.download(server, size=len(self.data) - 1)
+        self.assertFalse(result.ok)
+        self.assertIsInstance(result.error, ValueError)
+        self.assertEqual(len(server.requests), 1)
+        self.assertLeftNoPartFile()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+import asyncio
+import socket
+import threading
+import time
+import unittest
+from nplb.services.github import AsyncGitHubService, GitHubError, GitHubTimeoutError
+
+
+class GitHubTimeoutTest(unittest.TestCase):
+    """A stalled or unreachable GitHub must fail fast rather than hang the caller"""
+
+    def setUp(self):
+        # Accepts connections but never answers
+        self.server = socket.socket()
+        self.server.bind(('127.0.0.1', 0))
+        self.server.listen(8)
+        self.connections = []
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def tearDown(self):
+        self.server.close()
+        for connection in self.connections:
+            connection.close()
+
+    def _accept(self):
+        try:
+            while True:
+                self.connections.append(self.server.accept()[0])
+        except OSError:
+            pass
+
+    def test_stalled_response_times_out(self):
+        port = self.server.getsockname()[1]
+        github = AsyncGitHubService('', api_url=f"http://127.0.0.1:{port}", timeout=(1.0, 0.2), retries=1)
+        start = time.perf_counter()
+        with self.assertRaises(GitHubTimeoutError):
+            asyncio.run(github.get_releases('owner', 'repo'))
+        self.assertLess(time.perf_counter() - start, 5)
+
+    def test_refused_connection_is_not_a_timeout(self):
+        port = self.server.getsockname()[1]
+        self.server.close()
+        github = AsyncGitHubService('', api_url=f"http://127.0.0.1:{port}", timeout=(1.0, 1.0), retries=0)
+        with self.assertRaises(GitHubError) as raised:
+            asyncio.run(github.get_releases('owner', 'repo'))
+        self.assertNotIsInstance(raised.exception, GitHubTimeoutError)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+from functools import cmp_to_key
+import itertools
+import random
+import unittest
+from debian.debian_support import version_compare
+from nplb.services.index import PackageRecord, version_key
+
+
+def _sign(value: int) -> int:
+    return (value > 0) - (value < 0)
+
+
+class VersionKeyTest(unittest.TestCase):
+    """version_key must order versions exactly as dpkg does"""
+
+    VERSIONS = [
+        '0', '1', '9', '10', '1.0', '1.0~rc1', '1.0~~', '1.0~', '1.0+b1', '1.0.0', '1.00',
+        '1.0-1', '1.0-1ubuntu1', '1.0-1~bpo1', '1.0-1.1', '1.0a', '1.0A', '1.0-0',
+        '1:0', '1:0.5', '2:0.1', '0:1.0', '1:2:3-1', '1:2:3', '2:1:1', '1.2-3-4', '1.2-3-4-5',
+        '1.2.3-a', 'a', 'A', 'a1', '1a', '1.0+dfsg-2', '1.0+git20240101.abc123-1',
+    ]
+
+    def assertOrdered(self, a: str, b: str):
+        expected = _sign(version_compare(a, b))
+        actual = _sign((version_key(a) > version_key(b)) - (version_key(a) < version_key(b)))
+        self.assertEqual(actual, expected, f"{a!r} vs {b!r}")
+
+    def test_epoch_ends_at_first_colon(self):
+        self.assertGreater(version_key('1:2:3-1'), version_key('9'))
+        self.assertOrdered('1:2:3-1', '9')
+
+    def test_matches_dpkg_on_known_versions(self):
+        for a, b in itertools.product(self.VERSIONS, repeat=2):
+            self.assertOrdered(a, b)
+
+    def test_matches_dpkg_on_generated_versions(self):
+        rng = random.Random(0)
+        alphabet = '0123456789.+~abzAZ'
+
+        def part(length: int) -> str:
+            return ''.join(rng.choice(alphabet) for _ in range(length)).lstrip('.+~') or '0'
+
+        versions = []
+        for _ in range(400):
+            version = '1' + part(rng.randint(0, 6))
+            if rng.random() < 0.3:
+                version = f"{rng.randint(0, 3)}:{version}"
+            if rng.random() < 0.5:
+                version = f"{version}-{part(rng.randint(1, 4))}"
+            versions.append(version)
+        self.assertEqual(
+            sorted(versions, key=version_key),
+            sorted(versions, key=cmp_to_key(version_compare))
+        )
+
+
+class PackageRecordTest(unittest.TestCase):
+    STANZA = (
+        "Package: hello\nVersion: 1:2.10-3\nArchitecture: amd64\n"
+        "Maintainer: Example <dev@example.com>\nInstalled-Size: 10\nSection: utils\n"
+        "Description: greet\n Prints a greeting.\nFilename: pool/main/hello_2.10-3_amd64.deb"
+    )
+
+    def test_fields_are_not_stored_twice(self):
+        record = PackageRecord.from_stanza('hello_2.10-3_amd64.deb', 'f', self.STANZA)
+        self.assertEqual(
+            (record.package, record.version, record.architecture, record.section, record.maintainer),
+            ('hello', '1:2.10-3', 'amd64', 'utils', 'Example <dev@example.com>')
+        )
+        for value in ('hello', '2.10-3', 'amd64', 'utils', 'Example'):
+            self.assertNotIn(value, record.rest.split('Filename:')[0])
+
+    def test_stanza_round_trips(self):
+        stanzas = [
+            self.STANZA,
+            # Fields in unusual order, duplicated or not in canonical form are kept verbatim
+            "Description: x\nPackage: a\nsection: misc\nVersion:1.0\nArchitecture: all\nPackage: b",
+            "Filename: x.deb",
+        ]
+        for stanza in stanzas:
+            self.assertEqual(PackageRecord.from_stanza('x.deb', 'f', stanza).stanza, stanza)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+import os
+import tempfile
+import unittest
+import boto3
+from moto import mock_aws
+from nplb.core.models import DebAsset
+from nplb.services.download import NullSink
+from nplb.services.storage import S3StorageService
+
+MB = 1024 * 1024
+BUCKET = "nplb-test"
+
+
+class PublishSkipsUnchangedTest(unittest.TestCase):
+    """A re-publish must not upload pool objects S3 already has"""
+
+    def setUp(self):
+        mock = mock_aws()
+        mock.start()
+        self.addCleanup(mock.stop)
+        boto3.client('s3', region_name='us-east-1').create_bucket(Bucket=BUCKET)
+
+        self.storage = S3StorageService(
+            'key', 'secret', BUCKET, 'us-east-1',
+            max_concurrency=4, multipart_threshold=5 * MB, multipart_chunksize=5 * MB
+        )
+        self.requests = []
+        for operation in ('PutObject', 'CreateMultipartUpload', 'UploadPart'):
+            self.storage.client.meta.events.register(
+                f"provide-client-params.s3.{operation}",
+                lambda params, model, **kwargs: self.requests.append((model.name, params['Key']))
+            )
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+
+    def write(self, relative_path: str, data: bytes) -> Path:
+        path = self.directory / relative_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+        return path
+
+    def uploaded_keys(self):
+        return sorted({key for _, key in self.requests})
+
+    def test_republish_uploads_only_what_changed(self):
+        self.write("pool/main/small_1.0_amd64.deb", os.urandom(4096))
+        # Over the multipart threshold, so its ETag is not a plain MD5
+        self.write("pool/main/large_1.0_amd64.deb", os.urandom(6 * MB + 1))
+        self.write("dists/stable/main/binary-amd64/Packages", b"Package: small\n")
+        self.write("dists/stable/Release", b"Suite: stable\n")
+
+        first = self.storage.publish_repository(self.directory, "owner/repo")
+        self.assertEqual(len(first), 4)
+        self.assertIn(("CreateMultipartUpload", "owner/repo/pool/main/large_1.0_amd64.deb"), self.requests)
+
+        self.requests.clear()
+        self.assertEqual(self.storage.publish_repository(self.directory, "owner/repo"), [])
+        self.assertEqual(self.requests, [])
+
+        self.write("dists/stable/main/binary-amd64/Packages", b"Package: small\nPackage: large\n")
+        self.assertEqual(
+            self.storage.publish_repository(self.directory, "owner/repo"),
+            ["owner/repo/dists/stable/main/binary-amd64/Packages"]
+        )
+        self.assertEqual(self.uploaded_keys(), ["owner/repo/dists/stable/main/binary-amd64/Packages"])
+
+    def test_streamed_upload_matches_local_etag(self):
+        # Pool objects streamed from a download must be recognised as unchanged
+        # when the same file is later published from disk
+        data = os.urandom(11 * MB + 3)
+        path = self.write("pool/main/large_1.0_amd64.deb", data)
+        upload = self.storage.open_upload("owner/repo/pool/main/large_1.0_amd64.deb", len(data))
+        for i in range(0, len(data), 64 * 1024):
+            upload.write(data[i:i + 64 * 1024])
+        upload.close()
+
+        remote = self.storage.list_objects("owner/repo/pool/")
+        self.assertEqual(remote["owner/repo/pool/main/large_1.0_amd64.deb"]['ETag'], self.storage._local_etag(path))
+
+        self.requests.clear()
+        self.assertEqual(self.storage.publish_repository(self.directory, "owner/repo"), [])
+        self.assertEqual(self.requests, [])
+
+    def test_pool_uploads_skip_unchanged_assets(self):
+        data = os.urandom(4096)
+        key = "owner/repo/pool/main/hello_1.0_amd64.deb"
+        self.storage.client.put_object(Bucket=BUCKET, Key=key, Body=data)
+        written = self.storage.list_objects("owner/repo/pool/")[key]['LastModified']
+
+        def asset(size: int, updated_at: datetime) -> DebAsset:
+            return DebAsset(name="hello_1.0_amd64.deb", download_url="", size=size, updated_at=updated_at)
+
+        open_sink = self.storage.pool_uploads("owner/repo/pool/main")
+        self.assertIsInstance(open_sink(asset(len(data), written - timedelta(minutes=1))), NullSink)
+
+        cases = {
+            're-uploaded on GitHub': asset(len(data), written + timedelta(minutes=1)),
+            'different size': asset(len(data) + 1, written - timedelta(minutes=1)),
+            'no updated_at': asset(len(data), None),
+        }
+        for case, changed in cases.items():
+            with self.subTest(case):
+                sink = open_sink(changed)
+                self.addCleanup(sink.abort)
+                self.assertNotIsInstance(sink, NullSink)
+
+        new = DebAsset(name="new_1.0_amd64.deb", download_url="", size=1, updated_at=datetime.now(timezone.utc))
+        sink = open_sink(new)
+        self.addCleanup(sink.abort)
+        self.assertNotIsInstance(sink, NullSink)
+
+
+if __name__ == '__main__':
+    unittest.main()